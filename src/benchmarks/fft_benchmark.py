@@ -0,0 +1,62 @@
+import time
+import numpy as np
+import pandas as pd
+from ..common_functions.feature_engineering_functions import FourierTransformation
+
+
+def legacy_abstract_frequency(data_table: pd.DataFrame, cols: list[str], window_size: int, sampling_rate: int) -> pd.DataFrame:
+    """Row by row implementation of FourierTransformation.abstract_frequency, kept
+    here as the reference for the output and the speed of the batched engine.
+    """
+    freqs = np.round((np.fft.rfftfreq(int(window_size)) * sampling_rate), 3)
+    for col in cols:
+        data_table[col + "_max_freq"] = np.nan
+        data_table[col + "_freq_weighted"] = np.nan
+        data_table[col + "_pse"] = np.nan
+        for freq in freqs:
+            data_table[col + "_freq_" + str(freq) + "_Hz_ws_" + str(window_size)] = np.nan
+    for i in range(window_size, len(data_table.index)):
+        for col in cols:
+            transformation = np.fft.rfft(data_table[col].iloc[i - window_size : min(i + 1, len(data_table.index))])
+            real_ampl = transformation.real
+            for j in range(0, len(freqs)):
+                data_table.loc[i, col + "_freq_" + str(freqs[j]) + "_Hz_ws_" + str(window_size)] = real_ampl[j]
+            data_table.loc[i, col + "_max_freq"] = freqs[np.argmax(real_ampl[0 : len(real_ampl)])]
+            data_table.loc[i, col + "_freq_weighted"] = float(np.sum(freqs * real_ampl)) / np.sum(real_ampl)
+            PSD = np.divide(np.square(real_ampl), float(len(real_ampl)))
+            PSD_pdf = np.divide(PSD, np.sum(PSD))
+            data_table.loc[i, col + "_pse"] = -np.sum(np.log(PSD_pdf) * PSD_pdf)
+    return data_table
+
+
+def synthetic_set(n_rows: int, cols: list[str], seed: int = 0) -> pd.DataFrame:
+    """Random sensor-like signal, roughly the size of one set after resampling."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_rows) / 5
+    data = {col: np.sin(2 * np.pi * 0.4 * t + i) + 0.1 * rng.standard_normal(n_rows) for i, col in enumerate(cols)}
+    return pd.DataFrame(data)
+
+
+if __name__ == '__main__':
+    # Same columns and sampling rate used in build_features
+    cols = ["x_axis_g", "y_axis_g", "z_axis_g", "x_axis_deg_s", "y_axis_deg_s", "z_axis_deg_s", "acc_r", "gyr_r"]
+    sampling_rate = int(1000/200)
+    n_rows = 300 # Around one minute of data after resampling
+    freqabs = FourierTransformation()
+
+    print(f"{'window_size':>12} {'legacy (s)':>12} {'batched (s)':>12} {'speedup':>10} {'identical':>10}")
+    for window_size in (4, 8, 14, 28, 56):
+        df = synthetic_set(n_rows, cols)
+
+        start = time.perf_counter()
+        expected = legacy_abstract_frequency(df.copy(), cols, window_size, sampling_rate)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = freqabs.abstract_frequency(df.copy(), cols, window_size, sampling_rate)
+        batched_time = time.perf_counter() - start
+
+        identical = list(result.columns) == list(expected.columns) and np.array_equal(
+            result.to_numpy(), expected.to_numpy(), equal_nan=True
+        )
+        print(f"{window_size:>12} {legacy_time:>12.4f} {batched_time:>12.4f} {legacy_time / batched_time:>9.1f}x {str(identical):>10}")
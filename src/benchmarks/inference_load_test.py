@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+from ..common_functions.data_common_functions import get_files_directory, get_all_files_in_directory, read_sensor_files
+from ..common_functions.manifest_functions import get_recording_key
+
+
+def sample_windows(n_windows: int, window_seconds: float = 6.0, seed: int = 0) -> list[dict]:
+    """Raw sensor windows cut at random from the recordings of fitness_data."""
+    files_list = get_all_files_in_directory(get_files_directory())
+    recordings = sorted({get_recording_key(file_path) for file_path in files_list})
+    set_numbers = {file_path: recordings.index(get_recording_key(file_path)) for file_path in files_list}
+    df_acc, df_gyr, _ = read_sensor_files(files_list=files_list, set_numbers=set_numbers)
+    acc_by_set = {s: df[["epoch_ms", "x_axis_g", "y_axis_g", "z_axis_g"]].to_numpy() for s, df in df_acc.groupby("set")}
+    gyr_by_set = {s: df[["epoch_ms", "x_axis_deg_s", "y_axis_deg_s", "z_axis_deg_s"]].to_numpy() for s, df in df_gyr.groupby("set")}
+
+    rng = np.random.default_rng(seed)
+    windows = []
+    sets = sorted(set(acc_by_set) & set(gyr_by_set))
+    while len(windows) < n_windows:
+        set_number = sets[rng.integers(len(sets))]
+        acc, gyr = acc_by_set[set_number], gyr_by_set[set_number]
+        first, last = max(acc[0, 0], gyr[0, 0]), min(acc[-1, 0], gyr[-1, 0])
+        if last - first < window_seconds * 1000:
+            continue
+        start = rng.uniform(first, last - window_seconds * 1000)
+        end = start + window_seconds * 1000
+        windows.append({
+            "accelerometer": acc[(acc[:, 0] >= start) & (acc[:, 0] < end)].tolist(),
+            "gyroscope": gyr[(gyr[:, 0] >= start) & (gyr[:, 0] < end)].tolist()
+        })
+    return windows
+
+
+async def _client(host: str, port: int, requests: list[bytes], latencies: list[float], statuses: dict) -> None:
+    # One keep-alive connection per client, the requests are sent one after the other
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for body in requests:
+            start = time.perf_counter()
+            writer.write(
+                f"POST /predict HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                name, _, value = line.decode().partition(":")
+                headers[name.strip().lower()] = value.strip()
+            await reader.readexactly(int(headers["content-length"]))
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+async def load_test(host: str, port: int, windows: list[dict], n_requests: int, concurrency: int) -> None:
+    bodies = [json.dumps(windows[i % len(windows)]).encode() for i in range(n_requests)]
+    latencies, statuses = [], {}
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        _client(host, port, bodies[i::concurrency], latencies, statuses) for i in range(concurrency)
+    ])
+    seconds = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    print(f"{n_requests} requests, concurrency {concurrency}: {n_requests / seconds:.1f} requests/sec, "
+          f"p50={np.percentile(latencies, 50):.1f}ms p99={np.percentile(latencies, 99):.1f}ms, statuses={statuses}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test of the prediction server (src.models.predict_model).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--window-seconds", type=float, default=6.0)
+    args = parser.parse_args()
+
+    windows = sample_windows(n_windows=100, window_seconds=args.window_seconds)
+    for concurrency in args.concurrency:
+        asyncio.run(load_test(args.host, args.port, windows, args.requests, concurrency))
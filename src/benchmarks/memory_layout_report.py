@@ -0,0 +1,84 @@
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from ..common_functions.data_common_functions import SENSOR_COLUMNS, get_files_directory
+from ..common_functions.storage_functions import MemoryBackend
+from ..data_processing import ingest_data, merge_transform, remove_outliers, build_features
+from .synthetic_recordings import generate_recordings
+
+# Table written by every stage, in order
+STAGE_TABLES = [
+    ("ingest", ("stg", "fitness_tracker_accelerometer")),
+    ("ingest", ("stg", "fitness_tracker_gyroscope")),
+    ("merge", ("merged", "fitness_tracker")),
+    ("outliers", ("outliers", "fitness_tracker_chauvenet")),
+    ("features", ("clean", "fitness_tracker")),
+]
+
+
+def legacy_layout(df: pd.DataFrame, metadata_as_strings: bool = False) -> pd.DataFrame:
+    """The same table with the types the stages used before the dtype policy: 16 hex character
+    IDs and float64 features (the sensors were already read as float32). The stg tables also
+    had object strings for the metadata and a string per row for the filename, the later
+    stages got categoricals from read_table.
+    """
+    df = df.copy()
+    if metadata_as_strings:
+        for column in df.select_dtypes("category").columns:
+            df[column] = df[column].astype("str" if column == "filename" else object)
+    if "id" in df.columns and df["id"].dtype == np.int64:
+        df["id"] = pd.Series([f"{value:016x}" for value in df["id"].to_numpy().view(np.uint64)], index=df.index, dtype="string")
+    features = [column for column, dtype in df.dtypes.items() if dtype == np.float32 and column not in SENSOR_COLUMNS]
+    df[features] = df[features].astype(np.float64)
+    return df
+
+
+def _memory_mb(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / 2 ** 20
+
+
+def memory_report(data_dir_path: str, max_workers: int = 1) -> pd.DataFrame:
+    """Runs the stages in a MemoryBackend and measures the table every stage hands to the next
+    one, as it is now and with the legacy types.
+    """
+    storage = MemoryBackend()
+    with tempfile.TemporaryDirectory() as tmp_dir, contextlib.redirect_stdout(io.StringIO()):
+        ingest_data.run(storage, data_dir_path=data_dir_path, manifest_path=os.path.join(tmp_dir, "manifest.sqlite"))
+        merge_transform.run(storage, full_refresh=True)
+        remove_outliers.run(storage, full_refresh=True)
+        build_features.run(storage, max_workers=max_workers, full_refresh=True, model_dir=tmp_dir)
+
+    rows = []
+    for stage, key in STAGE_TABLES:
+        df = storage.tables[key]
+        before, after = _memory_mb(legacy_layout(df, metadata_as_strings=stage == "ingest")), _memory_mb(df)
+        rows.append({
+            "stage": stage,
+            "table": ".".join(key),
+            "rows": len(df.index),
+            "columns": len(df.columns),
+            "before (MB)": round(before, 2),
+            "after (MB)": round(after, 2),
+            "saved": f"{1 - after / before:.0%}"
+        })
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Memory of the table of every stage with the legacy types and with the dtype policy.")
+    parser.add_argument("--synthetic", action="store_true", help="Use synthetic recordings instead of fitness_data")
+    parser.add_argument("--participants", type=int, default=5)
+    parser.add_argument("--sets", type=int, default=12, help="Sets per participant")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds per set")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as synthetic_dir:
+        data_dir_path = get_files_directory()
+        if args.synthetic:
+            generate_recordings(synthetic_dir, args.participants, args.sets, args.duration)
+            data_dir_path = os.path.join(synthetic_dir, "*.csv")
+        print(memory_report(data_dir_path).to_string(index=False))
@@ -0,0 +1,75 @@
+import argparse
+import copy
+import gc
+import multiprocessing
+import time
+import numpy as np
+import pandas as pd
+from ..common_functions.data_common_functions import SENSOR_COLUMNS
+from ..common_functions.feature_engineering_functions import PrincipalComponentAnalysis
+
+
+def legacy_normalize_dataset(data_table: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+    """normalize_dataset before the float32 rewrite, kept as the reference for the memory use."""
+    dt_norm = copy.deepcopy(data_table)
+    for col in columns:
+        dt_norm[col] = (data_table[col] - data_table[col].mean()) / (
+            data_table[col].max()
+            - data_table[col].min()
+        )
+    return dt_norm
+
+
+def synthetic_table(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Frame shaped like the outliers table: float32 sensors and the string metadata."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({col: rng.standard_normal(n_rows, dtype=np.float32) for col in SENSOR_COLUMNS})
+    for column, values in (("participant", list("ABCDE")), ("label", ["bench", "ohp", "squat", "dead", "row", "rest"]),
+                           ("category", ["heavy", "medium", "sitting", "standing"])):
+        df[column] = np.array(values, dtype=object)[rng.integers(len(values), size=n_rows)]
+    df["set"] = rng.integers(1, 100, size=n_rows)
+    df["id"] = pd.util.hash_pandas_object(df[SENSOR_COLUMNS], index=False).to_numpy()
+    df["id"] = df["id"].map("{:016x}".format)
+    return df
+
+
+def _memory_mb(field: str) -> float:
+    # VmRSS (current) and VmHWM (peak) of /proc/self/status, in kilobytes
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    raise ValueError(f"Error: {field} is not in /proc/self/status")
+
+
+def _measure(method: str, n_rows: int, results) -> None:
+    df = synthetic_table(n_rows)
+    gc.collect()
+    # Reset the peak, so building the table does not count
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    baseline = _memory_mb("VmRSS")
+    start = time.perf_counter()
+    if method == "legacy":
+        normalized = legacy_normalize_dataset(df, SENSOR_COLUMNS)
+    else:
+        normalized = PrincipalComponentAnalysis().normalize_dataset(df, SENSOR_COLUMNS)
+    seconds = time.perf_counter() - start
+    results.put((method, baseline, _memory_mb("VmHWM"), seconds))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Peak RSS of normalize_dataset before and after the float32 rewrite.")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    # Every method runs in a fresh process, so its peak is not hidden by the previous one
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    print(f"{'method':>8} {'table (MB)':>12} {'peak (MB)':>11} {'extra (MB)':>11} {'seconds':>9}")
+    for method in ("legacy", "float32"):
+        process = context.Process(target=_measure, args=(method, args.rows, results))
+        process.start()
+        method, baseline, peak, seconds = results.get()
+        process.join()
+        print(f"{method:>8} {baseline:>12.0f} {peak:>11.0f} {peak - baseline:>11.0f} {seconds:>9.2f}")
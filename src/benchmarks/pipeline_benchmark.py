@@ -0,0 +1,264 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from ..common_functions.data_common_functions import (
+    SENSOR_COLUMNS, get_files_directory, get_all_files_in_directory, read_sensor_files,
+    extract_features_from_filename_column, get_datetime_from_epoch, merge_sensor_data
+)
+from ..common_functions.feature_engineering_functions import (
+    LowPassFilter, PrincipalComponentAnalysis, NumericalAbstraction, FourierTransformation
+)
+from ..common_functions.feature_extraction_functions import extract_features_by_set
+from ..common_functions.hashing_functions import hash_rows
+from ..common_functions.manifest_functions import get_recording_key
+from ..common_functions.outliers_functions import mark_outliers_iqr, mark_outliers_chauvenet, remove_outliers_chauvenet
+from ..common_functions.repetition_functions import count_repetitions
+from ..common_functions.storage_functions import MemoryBackend
+from ..data_processing import ingest_data, merge_transform, remove_outliers, build_features
+from ..data_processing.pipeline import PipelineParams
+from .synthetic_recordings import generate_recordings
+
+DEFAULT_RESULTS_DIR = str(Path(__file__).parent.parent.parent.joinpath("benchmark_results"))
+
+
+def time_call(func, make_args, repeat: int) -> dict:
+    """Runs func(*args, **kwargs) repeat times, with fresh arguments from make_args every time
+    (not timed), after one untimed warm-up run.
+
+    Returns:
+        dict: min, median and max seconds
+    """
+    seconds = []
+    for i in range(repeat + 1):
+        args, kwargs = make_args()
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        if i > 0:
+            seconds.append(time.perf_counter() - start)
+    return {"min": min(seconds), "median": float(np.median(seconds)), "max": max(seconds), "repeat": repeat}
+
+
+def load_sensor_data(data_dir_path: str) -> tuple[list[str], dict[str, int], pd.DataFrame, pd.DataFrame]:
+    """Files, set numbers (one per recording) and the ingested accelerometer and gyroscope data."""
+    files_list = sorted(get_all_files_in_directory(data_dir_path))
+    recordings = sorted({get_recording_key(file_path) for file_path in files_list})
+    set_numbers = {file_path: recordings.index(get_recording_key(file_path)) + 1 for file_path in files_list}
+    df_acc, df_gyr, _ = read_sensor_files(files_list=files_list, set_numbers=set_numbers)
+    df_acc = get_datetime_from_epoch(df=extract_features_from_filename_column(df=df_acc))
+    df_gyr = get_datetime_from_epoch(df=extract_features_from_filename_column(df=df_gyr))
+    return files_list, set_numbers, df_acc, df_gyr
+
+
+def function_benchmarks(data_dir_path: str, params: PipelineParams, repeat: int) -> dict[str, dict]:
+    """Times every pipeline function on its own, on the output of the previous steps. The
+    "rows" entry has the size of the raw and the merged data.
+    """
+    files_list, set_numbers, df_acc, df_gyr = load_sensor_data(data_dir_path)
+    df_merged = merge_sensor_data(df_acc, df_gyr, time_rule=params.time_rule)
+    df_outliers = remove_outliers_chauvenet(df_merged.drop(columns="id"), SENSOR_COLUMNS, group_col="label", C=params.chauvenet_c)
+    df_outliers[SENSOR_COLUMNS] = df_outliers[SENSOR_COLUMNS].interpolate()
+    df_outliers = df_outliers.dropna(subset=SENSOR_COLUMNS)
+    fs = pd.Timedelta("1s") / pd.Timedelta(params.time_rule)
+    df_lowpass = LowPassFilter().low_pass_filter_columns(
+        df_outliers.copy(), SENSOR_COLUMNS, fs, params.cutoff, group_col="set"
+    )
+    df_lowpass["acc_r"] = np.sqrt((df_lowpass[SENSOR_COLUMNS[:3]] ** 2).sum(axis=1))
+    df_lowpass["gyr_r"] = np.sqrt((df_lowpass[SENSOR_COLUMNS[3:]] ** 2).sum(axis=1))
+    magnitude_columns = SENSOR_COLUMNS + ["acc_r", "gyr_r"]
+
+    benchmarks = {
+        "read_sensor_files": (read_sensor_files, lambda: ((), {"files_list": files_list, "set_numbers": set_numbers})),
+        "merge_sensor_data": (merge_sensor_data, lambda: ((df_acc, df_gyr), {"time_rule": params.time_rule})),
+        "hash_rows": (hash_rows, lambda: ((df_merged.drop(columns="id"),), {})),
+        "mark_outliers_iqr": (mark_outliers_iqr, lambda: ((df_merged, SENSOR_COLUMNS), {})),
+        "mark_outliers_chauvenet": (mark_outliers_chauvenet, lambda: ((df_merged, SENSOR_COLUMNS), {"C": params.chauvenet_c})),
+        "remove_outliers_chauvenet": (remove_outliers_chauvenet, lambda: (
+            (df_merged, SENSOR_COLUMNS), {"group_col": "label", "C": params.chauvenet_c}
+        )),
+        "low_pass_filter_columns": (LowPassFilter().low_pass_filter_columns, lambda: (
+            (df_outliers.copy(), SENSOR_COLUMNS, fs, params.cutoff), {"group_col": "set"}
+        )),
+        "abstract_numerical_by_group": (NumericalAbstraction().abstract_numerical_by_group, lambda: (
+            (df_lowpass, magnitude_columns, params.rolling_window_size, ["mean", "std"]), {"group_col": "set"}
+        )),
+        "abstract_frequency": (FourierTransformation().abstract_frequency, lambda: (
+            (df_lowpass.reset_index(drop=True), magnitude_columns, params.fft_window_size, int(fs)), {}
+        )),
+        "apply_pca": (PrincipalComponentAnalysis().apply_pca, lambda: (
+            (df_lowpass.copy(), SENSOR_COLUMNS, params.pca_components), {}
+        )),
+        "extract_features_by_set": (extract_features_by_set, lambda: ((df_outliers, SENSOR_COLUMNS), {
+            "sampling_frequency": fs,
+            "cutoff_frequency": params.cutoff,
+            "rolling_window_size": params.rolling_window_size,
+            "fft_window_size": params.fft_window_size,
+            "max_workers": 1
+        })),
+        "count_repetitions": (count_repetitions, lambda: ((df_outliers,), {"sampling_frequency": fs})),
+    }
+    results = {"rows": {"raw": len(df_acc.index) + len(df_gyr.index), "merged": len(df_merged.index)}}
+    for name, (func, make_args) in benchmarks.items():
+        results[name] = time_call(func, make_args, repeat)
+        print(f"  {name:<28} {results[name]['median']:>9.4f}s")
+    return results
+
+
+def end_to_end_benchmark(data_dir_path: str, params: PipelineParams, repeat: int, max_workers: int = 1) -> dict[str, dict]:
+    """Times the four stages from the CSV files to the clean table, in a MemoryBackend and
+    with a temporary manifest and model directory, so nothing outside the run is touched.
+    """
+    seconds = {name: [] for name in ("stage.ingest", "stage.merge", "stage.outliers", "stage.features", "end_to_end")}
+    for _ in range(repeat):
+        storage = MemoryBackend()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stages = {
+                "stage.ingest": lambda: ingest_data.run(
+                    storage, data_dir_path=data_dir_path, manifest_path=os.path.join(tmp_dir, "manifest.sqlite")
+                ),
+                "stage.merge": lambda: merge_transform.run(storage, time_rule=params.time_rule, full_refresh=True),
+                "stage.outliers": lambda: remove_outliers.run(storage, C=params.chauvenet_c, full_refresh=True),
+                "stage.features": lambda: build_features.run(
+                    storage,
+                    time_rule=params.time_rule,
+                    cutoff=params.cutoff,
+                    pca_components=params.pca_components,
+                    rolling_window_size=params.rolling_window_size,
+                    fft_window_size=params.fft_window_size,
+                    n_clusters=params.n_clusters,
+                    max_workers=max_workers,
+                    full_refresh=True,
+                    model_dir=tmp_dir
+                )
+            }
+            total = 0.0
+            for name, run_stage in stages.items():
+                start = time.perf_counter()
+                # The stages print their progress, it is not part of the results
+                with contextlib.redirect_stdout(io.StringIO()):
+                    run_stage()
+                seconds[name].append(time.perf_counter() - start)
+                total += seconds[name][-1]
+            seconds["end_to_end"].append(total)
+    results = {
+        name: {"min": min(values), "median": float(np.median(values)), "max": max(values), "repeat": repeat}
+        for name, values in seconds.items()
+    }
+    results["end_to_end"]["rows"] = len(storage.tables[("clean", "fitness_tracker")].index)
+    for name, result in results.items():
+        print(f"  {name:<28} {result['median']:>9.4f}s")
+    return results
+
+
+def get_git_commit() -> str | None:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = 0.2) -> int:
+    """Prints the fastest run of every benchmark in both results files (less noisy than the
+    median) and flags the ones that are more than threshold (relative) slower or faster.
+
+    Returns:
+        int: Number of regressions
+    """
+    print(f"Baseline {baseline['meta']['commit']} ({baseline['meta']['timestamp']}) -> "
+          f"current {current['meta']['commit']} ({current['meta']['timestamp']})")
+    regressions = 0
+    for dataset, benchmarks in current["datasets"].items():
+        baseline_benchmarks = baseline["datasets"].get(dataset, {})
+        print(f"\n{dataset}")
+        if baseline_benchmarks and baseline_benchmarks.get("rows") != benchmarks["rows"]:
+            print(f"Warning: the data is not the same, rows {baseline_benchmarks.get('rows')} -> {benchmarks['rows']}")
+        print(f"{'benchmark':<28} {'baseline (s)':>13} {'current (s)':>12} {'ratio':>7}")
+        for name, result in benchmarks.items():
+            if name == "rows":
+                continue
+            if name not in baseline_benchmarks:
+                print(f"{name:<28} {'-':>13} {result['min']:>12.4f}")
+                continue
+            ratio = result["min"] / baseline_benchmarks[name]["min"]
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "slower"
+                regressions += 1
+            elif ratio < 1 - threshold:
+                flag = "faster"
+            print(f"{name:<28} {baseline_benchmarks[name]['min']:>13.4f} {result['min']:>12.4f} {ratio:>7.2f} {flag}".rstrip())
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Time the pipeline functions and the stages end to end (in memory, without Postgres) "
+                    "on the bundled recordings and on synthetic ones, and write the results to a JSON file."
+    )
+    parser.add_argument("--datasets", nargs="+", choices=["bundled", "synthetic"], default=["bundled", "synthetic"])
+    parser.add_argument("--participants", type=int, default=5, help="Synthetic participants")
+    parser.add_argument("--sets", type=int, default=12, help="Synthetic sets per participant")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds of every synthetic set")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs of every function")
+    parser.add_argument("--end-to-end-repeat", type=int, default=3, help="Timed runs of the stages")
+    parser.add_argument("--max-workers", type=int, default=1, help="Processes of the features stage")
+    parser.add_argument("--output", help="Results file. Defaults to benchmark_results/<timestamp>_<commit>.json")
+    parser.add_argument("--compare", help="Results file of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative change flagged in the comparison")
+    args = parser.parse_args()
+
+    params = PipelineParams()
+    results = {
+        "meta": {
+            "commit": get_git_commit(),
+            "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": asdict(params),
+            "args": vars(args)
+        },
+        "datasets": {}
+    }
+    with tempfile.TemporaryDirectory() as synthetic_dir:
+        data_dirs = {}
+        if "bundled" in args.datasets:
+            data_dirs["bundled"] = get_files_directory()
+        if "synthetic" in args.datasets:
+            generate_recordings(synthetic_dir, args.participants, args.sets, args.duration, args.seed)
+            data_dirs["synthetic"] = os.path.join(synthetic_dir, "*.csv")
+        for dataset, data_dir_path in data_dirs.items():
+            print(f"{dataset}: {len(get_all_files_in_directory(data_dir_path))} files")
+            results["datasets"][dataset] = {
+                **function_benchmarks(data_dir_path, params, args.repeat),
+                **end_to_end_benchmark(data_dir_path, params, args.end_to_end_repeat, args.max_workers)
+            }
+
+    output = args.output or os.path.join(
+        DEFAULT_RESULTS_DIR, f"{results['meta']['timestamp'].replace(':', '')}_{results['meta']['commit'] or 'nogit'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare_results(baseline, results, args.threshold):
+            raise SystemExit(1)
@@ -0,0 +1,54 @@
+import time
+import numpy as np
+import pandas as pd
+from ..common_functions.data_common_functions import (
+    SENSOR_COLUMNS, get_files_directory, get_all_files_in_directory, read_sensor_files,
+    extract_features_from_filename_column, get_datetime_from_epoch, merge_sensor_data
+)
+from ..common_functions.manifest_functions import get_recording_key
+from ..common_functions.repetition_functions import EXPECTED_REPS, REP_PRESETS, StreamingRepCounter, count_repetitions
+
+
+def load_recordings(time_rule: str = "200ms") -> pd.DataFrame:
+    """Merged and resampled data of all the recordings in fitness_data, one set per recording."""
+    files_list = get_all_files_in_directory(get_files_directory())
+    recordings = sorted({get_recording_key(file_path) for file_path in files_list})
+    set_numbers = {file_path: recordings.index(get_recording_key(file_path)) + 1 for file_path in files_list}
+    df_acc, df_gyr, _ = read_sensor_files(files_list=files_list, set_numbers=set_numbers)
+    df_acc = get_datetime_from_epoch(df=extract_features_from_filename_column(df=df_acc))
+    df_gyr = get_datetime_from_epoch(df=extract_features_from_filename_column(df=df_gyr))
+    return merge_sensor_data(df_acc, df_gyr, time_rule=time_rule)
+
+
+def count_repetitions_streaming(df: pd.DataFrame) -> pd.DataFrame:
+    """Counts the repetitions of every set feeding its samples one by one to a StreamingRepCounter."""
+    results = []
+    for (set_number, label), df_set in df.groupby(["set", "label"], observed=True, sort=False):
+        if label not in REP_PRESETS:
+            continue
+        counter = StreamingRepCounter(REP_PRESETS[label])
+        for values in df_set[SENSOR_COLUMNS].to_numpy(dtype=np.float64):
+            counter.push(values)
+        results.append({"set": set_number, "label": label, "reps": counter.finish()})
+    return pd.DataFrame(results, columns=["set", "label", "reps"])
+
+
+if __name__ == '__main__':
+    df = load_recordings()
+    # Only the sets with a known number of repetitions
+    df = df[df["category"].isin(list(EXPECTED_REPS))]
+    expected = df.groupby("set")["category"].first().astype(str).map(EXPECTED_REPS)
+    n_sets = df["set"].nunique()
+
+    for name, counter in (("batch", count_repetitions), ("streaming", count_repetitions_streaming)):
+        start = time.perf_counter()
+        reps = counter(df)
+        seconds = time.perf_counter() - start
+        reps["expected"] = reps["set"].map(expected)
+        reps["error"] = (reps["reps"] - reps["expected"]).abs()
+        summary = reps.groupby("label", observed=True).agg(
+            sets=("set", "size"), mean_abs_error=("error", "mean"), exact=("error", lambda error: (error == 0).mean())
+        )
+        print(f"\n{name}: {n_sets} sets in {seconds:.3f}s ({n_sets / seconds:.1f} sets/sec), "
+              f"mean abs error={reps['error'].mean():.2f}, exact={(reps['error'] == 0).mean():.0%}")
+        print(summary.to_string(float_format="{:.2f}".format))
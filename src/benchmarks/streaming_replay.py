@@ -0,0 +1,90 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from ..common_functions.data_common_functions import (
+    ACCELEROMETER_COLUMNS, SENSOR_COLUMNS, get_files_directory, get_all_files_in_directory,
+    read_sensor_files, extract_features_from_filename_column, get_datetime_from_epoch, merge_sensor_data
+)
+from ..common_functions.feature_extraction_functions import extract_set_features
+from ..common_functions.manifest_functions import get_recording_key
+from ..common_functions.streaming_functions import GYROSCOPE_AXES, StreamingResampler, StreamingFeatureExtractor
+
+
+def replay(files_list: list[str], speed: float = 1.0, time_rule: str = "200ms") -> tuple[pd.DataFrame, np.ndarray]:
+    """Feeds the raw samples of a recording to the streaming path in timestamp order, waiting
+    between samples so they arrive like a live feed (speed times faster than real time,
+    0 does not wait).
+
+    Returns:
+        tuple: The streamed features indexed by bin and the seconds spent on every sample
+    """
+    df_acc, df_gyr, _ = read_sensor_files(files_list=files_list)
+    events = pd.concat([
+        df_acc[["epoch_ms"] + ACCELEROMETER_COLUMNS].set_axis(["epoch_ms", "a", "b", "c"], axis=1).assign(sensor="Accelerometer"),
+        df_gyr[["epoch_ms"] + GYROSCOPE_AXES].set_axis(["epoch_ms", "a", "b", "c"], axis=1).assign(sensor="Gyroscope")
+    ]).sort_values("epoch_ms", kind="stable")
+
+    resampler = StreamingResampler(time_rule=time_rule)
+    extractor = StreamingFeatureExtractor(sampling_frequency=pd.Timedelta("1s") / pd.Timedelta(time_rule))
+    bins, features, latencies = [], [], []
+
+    def extract(rows):
+        for bin_ms, values in rows:
+            bins.append(bin_ms)
+            features.append(extractor.push(values))
+
+    first_epoch = events["epoch_ms"].iloc[0]
+    replay_start = time.perf_counter()
+    for epoch_ms, a, b, c, sensor in events.itertuples(index=False):
+        if speed > 0:
+            delay = (epoch_ms - first_epoch) / 1000 / speed - (time.perf_counter() - replay_start)
+            if delay > 0:
+                time.sleep(delay)
+        start = time.perf_counter()
+        extract(resampler.push(sensor, epoch_ms, np.array([a, b, c], dtype=np.float64)))
+        latencies.append(time.perf_counter() - start)
+    extract(resampler.flush())
+
+    df_features = pd.DataFrame(features, columns=extractor.feature_names, index=pd.to_datetime(bins, unit="ms"))
+    return df_features, np.array(latencies)
+
+
+def batch_features(files_list: list[str], time_rule: str = "200ms") -> pd.DataFrame:
+    """Features of the recording computed by the batch path, with the causal lowpass filter."""
+    df_acc, df_gyr, _ = read_sensor_files(files_list=files_list)
+    df_acc = get_datetime_from_epoch(df=extract_features_from_filename_column(df=df_acc))
+    df_gyr = get_datetime_from_epoch(df=extract_features_from_filename_column(df=df_gyr))
+    df_merged = merge_sensor_data(df_acc, df_gyr, time_rule=time_rule)
+    df_features = extract_set_features(
+        df_merged,
+        SENSOR_COLUMNS,
+        sampling_frequency=pd.Timedelta("1s") / pd.Timedelta(time_rule),
+        cutoff_frequency=1.3,
+        rolling_window_size=5,
+        fft_window_size=14,
+        phase_shift=False
+    )
+    df_features.index = df_merged.index
+    return df_features
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay recordings of fitness_data as a live feed and compare the streamed features with the batch ones.")
+    parser.add_argument("--recordings", type=int, default=1, help="Number of recordings to replay")
+    parser.add_argument("--speed", type=float, default=1.0, help="Times faster than real time, 0 replays without waiting")
+    args = parser.parse_args()
+
+    files_by_recording = {}
+    for file_path in sorted(get_all_files_in_directory(get_files_directory())):
+        files_by_recording.setdefault(get_recording_key(file_path), []).append(file_path)
+
+    for recording, files_list in list(files_by_recording.items())[:args.recordings]:
+        streamed, latencies = replay(files_list, speed=args.speed)
+        expected = batch_features(files_list)
+        same_shape = streamed.shape == expected.shape and streamed.index.equals(expected.index) \
+            and list(streamed.columns) == list(expected.columns)
+        max_diff = np.nanmax(np.abs(streamed.to_numpy() - expected.to_numpy())) if same_shape else np.nan
+        equivalent = same_shape and np.allclose(streamed.to_numpy(), expected.to_numpy(), rtol=1e-7, atol=1e-9, equal_nan=True)
+        print(f"{recording}: {len(streamed.index)} rows, equivalent={equivalent}, max abs diff={max_diff:.2e}, "
+              f"per sample mean={latencies.mean() * 1e6:.1f}us p99={np.percentile(latencies, 99) * 1e6:.1f}us")
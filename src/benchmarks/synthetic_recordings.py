@@ -0,0 +1,108 @@
+import argparse
+import os
+import string
+import numpy as np
+import pandas as pd
+
+# Exercises with their repetitions per second, rest has no repetitions
+EXERCISES = {"bench": 0.45, "ohp": 0.45, "squat": 0.4, "dead": 0.4, "row": 0.6, "rest": 0.0}
+SAMPLING_PERIODS_MS = {"Accelerometer": 80, "Gyroscope": 40}
+SENSOR_HEADERS = {
+    "Accelerometer": ["x-axis (g)", "y-axis (g)", "z-axis (g)"],
+    "Gyroscope": ["x-axis (deg/s)", "y-axis (deg/s)", "z-axis (deg/s)"]
+}
+SENSOR_FILE_SUFFIXES = {"Accelerometer": "Accelerometer_12.500Hz_1.4.4.csv", "Gyroscope": "Gyroscope_25.000Hz_1.4.4.csv"}
+
+
+def participant_name(index: int) -> str:
+    # A, B, ... like the bundled recordings, then P26, P27, ... (no '-' or '_', they separate the filename fields)
+    return string.ascii_uppercase[index] if index < len(string.ascii_uppercase) else f"P{index}"
+
+
+def _sensor_values(rng: np.random.Generator, file_type: str, n_samples: int, rep_frequency: float) -> np.ndarray:
+    t = np.arange(n_samples) * SAMPLING_PERIODS_MS[file_type] / 1000
+    phases = rng.uniform(0, 2 * np.pi, size=3)
+    if file_type == "Accelerometer":
+        offset, amplitude, noise = rng.normal([0.0, 0.95, -0.1], 0.1), rng.uniform(0.1, 0.4, size=3), 0.02
+    else:
+        offset, amplitude, noise = rng.normal(0.0, 2.0, size=3), rng.uniform(10, 60, size=3), 2.0
+    if rep_frequency == 0:
+        amplitude = amplitude * 0.05
+    values = offset + amplitude * np.sin(2 * np.pi * rep_frequency * t[:, None] + phases) \
+        + noise * rng.standard_normal((n_samples, 3))
+    # A few spikes, so the outlier detection has something to remove
+    spikes = rng.random(n_samples) < 0.005
+    values[spikes] *= rng.uniform(3, 6, size=(spikes.sum(), 1))
+    return values
+
+
+def _write_sensor_file(file_path: str, start: pd.Timestamp, file_type: str, values: np.ndarray) -> None:
+    epoch_ms = start.value // 10 ** 6 + np.arange(len(values)) * SAMPLING_PERIODS_MS[file_type]
+    timestamps = pd.to_datetime(epoch_ms, unit="ms")
+    df = pd.DataFrame({
+        "epoch (ms)": epoch_ms,
+        "time (01:00)": timestamps.strftime("%Y-%m-%dT%H:%M:%S.%f").str[:-3],
+        "elapsed (s)": (epoch_ms - epoch_ms[0]) / 1000
+    })
+    df[SENSOR_HEADERS[file_type]] = values
+    df.to_csv(file_path, index=False, float_format="%.3f")
+
+
+def generate_recordings(output_dir: str,
+                        n_participants: int = 5,
+                        sets_per_participant: int = 12,
+                        duration_seconds: float = 60.0,
+                        seed: int = 0) -> list[str]:
+    """Writes synthetic MetaWear recordings (an accelerometer file at 12.5Hz and a gyroscope
+    file at 25Hz per set) with the same columns and filename conventions as fitness_data, so
+    they go through the pipeline like the bundled ones. The same arguments always produce the
+    same files.
+
+    Args:
+        output_dir (str): Directory of the CSV files, created if needed
+        n_participants (int, optional): Participants. Defaults to 5.
+        sets_per_participant (int, optional): Sets of every participant, the exercises are used
+                                              in turns. Defaults to 12.
+        duration_seconds (float, optional): Duration of every set. Defaults to 60.0.
+        seed (int, optional): Seed of the signals. Defaults to 0.
+
+    Returns:
+        list: Paths of the files that were written
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    labels = list(EXERCISES)
+    files = []
+    for participant in range(n_participants):
+        # Every participant records on its own day, with a pause of two minutes between sets
+        start = pd.Timestamp("2019-01-11T10:00:00") + pd.Timedelta(days=participant)
+        for set_index in range(sets_per_participant):
+            label = labels[set_index % len(labels)]
+            if label == "rest":
+                category = ("sitting", "standing")[(set_index // len(labels)) % 2]
+            else:
+                category = ("heavy", "medium")[(set_index // len(labels)) % 2]
+            set_start = start + pd.Timedelta(seconds=set_index * (duration_seconds + 120))
+            recording = (
+                f"{participant_name(participant)}-{label}-{category}{set_index % 3 + 1}_MetaWear_"
+                f"{set_start.strftime('%Y-%m-%dT%H.%M.%S.%f')[:-3]}_C42732BE255C"
+            )
+            for file_type, period_ms in SAMPLING_PERIODS_MS.items():
+                n_samples = int(duration_seconds * 1000 / period_ms)
+                values = _sensor_values(rng, file_type, n_samples, EXERCISES[label])
+                file_path = os.path.join(output_dir, f"{recording}_{SENSOR_FILE_SUFFIXES[file_type]}")
+                _write_sensor_file(file_path, set_start, file_type, values)
+                files.append(file_path)
+    return files
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write synthetic MetaWear recordings.")
+    parser.add_argument("output_dir")
+    parser.add_argument("--participants", type=int, default=5)
+    parser.add_argument("--sets", type=int, default=12, help="Sets per participant")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds per set")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    files = generate_recordings(args.output_dir, args.participants, args.sets, args.duration, args.seed)
+    print(f"Wrote {len(files)} files to {args.output_dir}")
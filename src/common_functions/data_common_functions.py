@@ -1,48 +1,116 @@
+import numpy as np
 import pandas as pd
 from sqlalchemy.exc import SQLAlchemyError
 from hashlib import md5
-from sqlalchemy import create_engine
-from sqlalchemy import create_engine, text
+from sqlalchemy import Integer, MetaData, Table, inspect, select, text
+from sqlalchemy.engine import Engine
 from pathlib import Path
 from glob import glob
 import os
+import csv
+import time
+from io import StringIO
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from .hashing_functions import hash_rows
+from .instrumentation_functions import instrument
+from .database_functions import DatabaseConfig, get_engine
 
 #########################################################################
 #########################################################################
 ############################# Utilites ##################################
 
 
+# Row by row md5 IDs of the tables written before ID scheme 2 (see hash_rows), kept for compatibility
 def create_id(row) -> pd.Series:
     concat_string = ''.join(row.astype(str))
     sha256_hash = md5(concat_string.encode()).hexdigest()
     return sha256_hash
 
-def resample_frequency(df: pd.DataFrame) -> pd.DataFrame:
-    # Sampling rule
-    sampling_rule = {
-        'x_axis_g': 'mean',
-        'y_axis_g': 'mean',
-        'z_axis_g': 'mean',
-        'category': 'last',
-        'label': 'last',
-        'participant': 'last',
-        'x_axis_deg_s': 'mean',
-        'y_axis_deg_s': 'mean',
-        'z_axis_deg_s': 'mean',
-        'set': 'last'
-    }
-    # We have to use a frequency that gives us a good amount of data,
-    # but not too much that becomes too expensive to compute
-    time_rule = '200ms'
-
-    # The dataframe will become to large if we resample everything in one go.
-    # So we are going to group by day (this is possible because the index is a date),
-    # and perfom the sampling in each of those groups and then concat everything
-    days = [group for i, group in df.groupby(pd.Grouper(freq='D'))] # This is a collection of dataframes
-    df_resampled = pd.concat([df.resample(rule=time_rule).apply(sampling_rule).dropna() for df in days])
-    df_resampled["id"] = df_resampled.apply(create_id, axis=1).astype("string")
+# Aggregation of every column of the merged sensor data when it is resampled
+SAMPLING_RULE = {
+    'x_axis_g': 'mean',
+    'y_axis_g': 'mean',
+    'z_axis_g': 'mean',
+    'category': 'last',
+    'label': 'last',
+    'participant': 'last',
+    'x_axis_deg_s': 'mean',
+    'y_axis_deg_s': 'mean',
+    'z_axis_deg_s': 'mean',
+    'set': 'last'
+}
+
+def _resample_bins(df: pd.DataFrame, bins: np.ndarray, sampling_rule: dict) -> pd.DataFrame:
+    # Only the bins that have data exist as groups, so there are no empty bins to drop
+    df_resampled = df.groupby(bins, sort=True).agg(sampling_rule)
+    df_resampled.index = pd.DatetimeIndex(df_resampled.index.to_numpy().astype("datetime64[ns]"), name=df.index.name)
+    return df_resampled.dropna()
+
+@instrument()
+def resample_frequency(df: pd.DataFrame,
+                       time_rule: str = '200ms',
+                       sampling_rule: dict | None = None) -> pd.DataFrame:
+    """Resamples a dataframe with a datetime index by putting every timestamp in its bin
+    (floor division of the epoch by the rule) and aggregating the populated bins. Bins without
+    a value for every column are dropped, like resample(...).apply(...).dropna().
+
+    Args:
+        df (pd.DataFrame): The dataset, with a datetime index
+        time_rule (str, optional): Size of the bins. We have to use a frequency that gives us a good
+                                   amount of data, but not too much that becomes too expensive to
+                                   compute. Defaults to '200ms'.
+        sampling_rule (dict, optional): Aggregation per column. Defaults to SAMPLING_RULE.
+
+    Returns:
+        pd.DataFrame: The resampled dataframe with an id column
+    """
+    df_resampled = _resample(df, time_rule, sampling_rule or SAMPLING_RULE)
+    df_resampled["id"] = hash_rows(df_resampled)
     return df_resampled
 
+def _resample(df: pd.DataFrame, time_rule: str, sampling_rule: dict) -> pd.DataFrame:
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+    epoch_ns = df.index.as_unit("ns").asi8
+    bins = epoch_ns - epoch_ns % pd.Timedelta(time_rule).value
+    return _resample_bins(df, bins, sampling_rule)
+
+# Columns that come from each sensor in the merged data, the metadata comes from the gyroscope
+ACCELEROMETER_COLUMNS = ["x_axis_g", "y_axis_g", "z_axis_g"]
+GYROSCOPE_COLUMNS = ["category", "label", "participant", "x_axis_deg_s", "y_axis_deg_s", "z_axis_deg_s", "set"]
+# Axes of both sensors
+SENSOR_COLUMNS = ACCELEROMETER_COLUMNS + ["x_axis_deg_s", "y_axis_deg_s", "z_axis_deg_s"]
+
+@instrument()
+def merge_sensor_data(df_acc: pd.DataFrame,
+                      df_gyr: pd.DataFrame,
+                      time_rule: str = '200ms') -> pd.DataFrame:
+    """Merges the accelerometer (12.5Hz) and gyroscope (25Hz) data. Both streams are resampled
+    to the same bins first and then joined on the bins that are in both, so there is never
+    a sparse frame with the raw timestamps of the two sensors. The result is the same as
+    resample_frequency over the outer concat of the two sensors.
+
+    Args:
+        df_acc (pd.DataFrame): Accelerometer data with a datetime index
+        df_gyr (pd.DataFrame): Gyroscope data with a datetime index
+        time_rule (str, optional): Size of the bins. Defaults to '200ms'.
+
+    Returns:
+        pd.DataFrame: The merged and resampled dataframe with an id column
+    """
+    df_acc_resampled = _resample(
+        df_acc[ACCELEROMETER_COLUMNS], time_rule,
+        {column: SAMPLING_RULE[column] for column in ACCELEROMETER_COLUMNS}
+    )
+    df_gyr_resampled = _resample(
+        df_gyr[GYROSCOPE_COLUMNS], time_rule,
+        {column: SAMPLING_RULE[column] for column in GYROSCOPE_COLUMNS}
+    )
+    df_merged = df_acc_resampled.join(df_gyr_resampled, how="inner")[list(SAMPLING_RULE)]
+    df_merged["id"] = hash_rows(df_merged)
+    return df_merged
+
 def get_files_directory() -> str:
     path = Path(__file__).parent.parent.parent
     data_dir_path = str(path.joinpath("fitness_data", "*.csv"))
@@ -60,18 +128,28 @@ def get_all_files_in_directory(dir_path: str) -> list[str]:
     files = glob(dir_path, recursive=True)
     return files
 
+@instrument()
 def extract_features_from_filename_column(df: pd.DataFrame) -> pd.DataFrame:
-    df["participant"] = df["filename"].str.split("-").str[0]
-    df["label"] = df["filename"].str.split("-").str[1]
-    df["category"] = df["filename"].str.split("-").str[2].str.split("_").str[0].str.rstrip("123")
-    df["id"] = df.apply(create_id, axis=1)
+    # There are only a few distinct filenames, so every one of them is parsed once and the
+    # rows get the codes of their file. The new columns are categoricals, like the filename.
+    df["filename"] = df["filename"].astype("category")
+    codes = df["filename"].cat.codes.to_numpy()
+    parts = df["filename"].cat.categories.to_series().str.split("-")
+    for column, values in (
+        ("participant", parts.str[0]),
+        ("label", parts.str[1]),
+        ("category", parts.str[2].str.split("_").str[0].str.rstrip("123"))
+    ):
+        categories, inverse = np.unique(values.to_numpy(dtype=str), return_inverse=True)
+        df[column] = pd.Categorical.from_codes(inverse[codes], categories=categories)
+    df["id"] = hash_rows(df)
     return df
 
+@instrument()
 def get_datetime_from_epoch(df: pd.DataFrame) -> pd.DataFrame:
     df.index = pd.to_datetime(df["epoch_ms"], unit="ms")
-    del df["epoch_ms"]
-    del df["time"]
-    del df["elapsed_seconds"]
+    # time and elapsed_seconds are not there when the files were read with read_sensor_files
+    df = df.drop(columns=["epoch_ms", "time", "elapsed_seconds"], errors="ignore")
     return df
 
 #########################################################################
@@ -84,6 +162,98 @@ def get_datetime_from_epoch(df: pd.DataFrame) -> pd.DataFrame:
 #########################################################################
 ############################# Data movement #############################
 
+# Columns we need from every MetaWear file, their final names and their types.
+# "time (01:00)" and "elapsed (s)" are redundant with "epoch (ms)" so they are not read.
+SENSOR_SCHEMAS = {
+    "Accelerometer": {
+        "epoch (ms)": ("epoch_ms", "int64"),
+        "x-axis (g)": ("x_axis_g", "float32"),
+        "y-axis (g)": ("y_axis_g", "float32"),
+        "z-axis (g)": ("z_axis_g", "float32")
+    },
+    "Gyroscope": {
+        "epoch (ms)": ("epoch_ms", "int64"),
+        "x-axis (deg/s)": ("x_axis_deg_s", "float32"),
+        "y-axis (deg/s)": ("y_axis_deg_s", "float32"),
+        "z-axis (deg/s)": ("z_axis_deg_s", "float32")
+    }
+}
+
+def _read_sensor_file(file_path: str, file_type: str, set_number: int) -> tuple[pd.DataFrame, dict]:
+    schema = SENSOR_SCHEMAS[file_type]
+    start = time.perf_counter()
+    df = pd.read_csv(
+        file_path,
+        usecols=list(schema),
+        dtype={column: dtype for column, (_, dtype) in schema.items()}
+    )
+    df = df.rename(columns={column: name for column, (name, _) in schema.items()})
+    # The filename column is added by read_sensor_files, as a categorical of all the files
+    df = df.assign(set=set_number)
+    timing = {
+        "filename": os.path.basename(file_path),
+        "file_type": file_type,
+        "rows": len(df.index),
+        "seconds": time.perf_counter() - start
+    }
+    return df, timing
+
+def _concat_sensor_files(files: list[tuple[pd.DataFrame, str]]) -> pd.DataFrame:
+    # The filename is a categorical built from the row counts, instead of a string per row
+    df = pd.concat([df for df, _ in files], ignore_index=True)
+    codes = np.repeat(np.arange(len(files)), [len(df_file.index) for df_file, _ in files])
+    df.insert(df.columns.get_loc("set"), "filename", pd.Categorical.from_codes(codes, categories=[name for _, name in files]))
+    return df
+
+@instrument()
+def read_sensor_files(files_list: list[str],
+                      max_workers: int | None = None,
+                      use_processes: bool = False,
+                      set_numbers: dict[str, int] | None = None) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Reads the accelerometer and the gyroscope files concurrently, scanning the file list only once.
+    Only the epoch and the axes columns are loaded, with explicit dtypes.
+
+    Args:
+        files_list (list): File paths, as returned by get_all_files_in_directory
+        max_workers (int, optional): Size of the pool. Defaults to the executor default.
+        use_processes (bool, optional): Use a process pool instead of a thread pool. Defaults to False.
+        set_numbers (dict, optional): Set number of every file, e.g. from FileManifest.assign_set_numbers.
+                                      Defaults to numbering the files per sensor in list order.
+
+    Returns:
+        tuple: Accelerometer dataframe, gyroscope dataframe and a dataframe with the
+        rows and seconds it took to read every file (slowest first).
+    """
+    # By default sets are numbered per sensor in the order of the file list, like read_data_into_dataframe
+    tasks = []
+    file_counts = dict.fromkeys(SENSOR_SCHEMAS, 0)
+    for file_path in files_list:
+        for file_type in SENSOR_SCHEMAS:
+            if file_type in file_path:
+                file_counts[file_type] += 1
+                set_number = set_numbers[file_path] if set_numbers is not None else file_counts[file_type]
+                tasks.append((file_path, file_type, set_number))
+                break
+
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor_class(max_workers=max_workers) as executor:
+        results = list(executor.map(_read_sensor_file, *zip(*tasks))) if tasks else []
+
+    dfs = {file_type: [] for file_type in SENSOR_SCHEMAS}
+    for (_, file_type, _), (df, timing) in zip(tasks, results):
+        dfs[file_type].append((df, timing["filename"]))
+    df_acc, df_gyr = [
+        _concat_sensor_files(dfs[file_type]) if dfs[file_type]
+        else pd.DataFrame(columns=[name for name, _ in SENSOR_SCHEMAS[file_type].values()] + ["filename", "set"])
+        for file_type in ("Accelerometer", "Gyroscope")
+    ]
+    df_timings = pd.DataFrame(
+        [timing for _, timing in results],
+        columns=["filename", "file_type", "rows", "seconds"]
+    ).sort_values("seconds", ascending=False, ignore_index=True)
+    return df_acc, df_gyr, df_timings
+
+@instrument()
 def read_data_into_dataframe(files_list: list, file_type: str) -> pd.DataFrame:
     relevant_files = [file_path for file_path in files_list if file_type in file_path]
     df_list = [pd.read_csv(file).assign(filename=os.path.basename(file), set=i) for i, file in enumerate(relevant_files,1)]
@@ -115,80 +285,283 @@ def read_data_into_dataframe(files_list: list, file_type: str) -> pd.DataFrame:
         )
     return df
 
+# Types of the known columns when they are read from the database
+COLUMN_DTYPES = {
+    "x_axis_g": "float32",
+    "y_axis_g": "float32",
+    "z_axis_g": "float32",
+    "x_axis_deg_s": "float32",
+    "y_axis_deg_s": "float32",
+    "z_axis_deg_s": "float32",
+    "participant": "category",
+    "label": "category",
+    "category": "category",
+    "filename": "category",
+    "set": "int64"
+}
+
+def apply_dtype_policy(df: pd.DataFrame) -> pd.DataFrame:
+    """Compact types used by every stage: the known columns get their type in COLUMN_DTYPES
+    (categoricals for the metadata and float32 for the sensors) and the remaining float64
+    columns (the features) become float32. The id keeps the type of hash_rows.
+
+    Args:
+        df (pd.DataFrame): The dataset
+
+    Returns:
+        pd.DataFrame: The dataset with the new types (a new dataframe when a column changes)
+    """
+    dtypes = {column: dtype for column, dtype in COLUMN_DTYPES.items() if column in df.columns}
+    dtypes.update({column: "float32" for column, dtype in df.dtypes.items() if dtype == np.float64})
+    dtypes = {column: dtype for column, dtype in dtypes.items() if df[column].dtype != dtype}
+    return df.astype(dtypes) if dtypes else df
+
+def read_sql_table_chunks(table_schema: str,
+                          table_name: str,
+                          config: DatabaseConfig | None = None,
+                          chunksize: int = 100000,
+                          columns: list[str] | None = None,
+                          participants: list[str] | None = None,
+                          labels: list[str] | None = None,
+                          start: pd.Timestamp | None = None,
+                          end: pd.Timestamp | None = None) -> Iterator[pd.DataFrame]:
+    """Reads a table chunk by chunk with a server side cursor, so the whole table is never in memory.
+    The filters are applied in the database.
+
+    Args:
+        table_schema (str): Schema of the table
+        table_name (str): Name of the table
+        config (DatabaseConfig, optional): Connection settings. Defaults to DatabaseConfig.from_env().
+        chunksize (int, optional): Rows per chunk. Defaults to 100000.
+        columns (list, optional): Columns to read besides epoch_ms. Defaults to all of them.
+        participants (list, optional): Only read these participants. Defaults to all of them.
+        labels (list, optional): Only read these labels. Defaults to all of them.
+        start (pd.Timestamp, optional): Only read rows with epoch_ms >= start.
+        end (pd.Timestamp, optional): Only read rows with epoch_ms < end.
+
+    Yields:
+        pd.DataFrame: Chunks indexed by epoch_ms, with the types in COLUMN_DTYPES
+    """
+    engine = get_engine(config)
+    try:
+        table = Table(table_name, MetaData(), schema=table_schema, autoload_with=engine)
+        selected_columns = [table.c["epoch_ms"]] + [table.c[column] for column in columns] \
+            if columns is not None else list(table.c)
+        query = select(*selected_columns)
+        if participants is not None:
+            query = query.where(table.c["participant"].in_(participants))
+        if labels is not None:
+            query = query.where(table.c["label"].in_(labels))
+        if start is not None:
+            query = query.where(table.c["epoch_ms"] >= start)
+        if end is not None:
+            query = query.where(table.c["epoch_ms"] < end)
+        dtypes = {column.name: COLUMN_DTYPES[column.name] for column in selected_columns if column.name in COLUMN_DTYPES}
+        with engine.connect().execution_options(stream_results=True) as conn:
+            for df in pd.read_sql_query(query, con=conn, chunksize=chunksize, dtype=dtypes):
+                df.index = df["epoch_ms"].astype('datetime64[ns]')
+                # We want epoch_ms only in the index
+                del df["epoch_ms"]
+                yield df
+    except SQLAlchemyError as e:
+        raise SQLAlchemyError(f"An error ocurred while reading the data: {e}")
+
+@instrument()
 def read_sql_table(table_schema: str,
                    table_name: str,
-                   username: str,
-                   password: str,
-                   hostname: str,
-                   port: int,
-                   database: str ) -> pd.DataFrame:
-    conn_string = f"postgresql+psycopg2://{username}:{password}@{hostname}:{port}/{database}"
-    engine = create_engine(conn_string)
+                   config: DatabaseConfig | None = None,
+                   **filters) -> pd.DataFrame:
+    """Reads a whole table (or the part selected by the read_sql_table_chunks filters) into a dataframe."""
+    df = pd.concat(read_sql_table_chunks(table_schema, table_name, config, **filters))
+    # Every chunk has its own categories, concat turns them back into strings
+    categorical_columns = [column for column, dtype in COLUMN_DTYPES.items() if dtype == "category" and column in df.columns]
+    df[categorical_columns] = df[categorical_columns].astype("category")
+    return df
+
+def read_distinct_values(table_schema: str,
+                         table_name: str,
+                         column: str,
+                         config: DatabaseConfig | None = None) -> set:
+    """Returns the distinct values of a column, or an empty set when the table does not exist."""
+    engine = get_engine(config)
     try:
-        # Read table
-        df = pd.read_sql_table(
-            table_name=table_name,
-            schema=table_schema,
-            con=engine
-        )
-        df.index = df["epoch_ms"].astype('datetime64[ns]')
-        # We want epoch_ms only in the index
-        del df["epoch_ms"]
-        engine.dispose()
+        if not inspect(engine).has_table(table_name, schema=table_schema):
+            return set()
+        table = Table(table_name, MetaData(), schema=table_schema, autoload_with=engine)
+        with engine.connect() as conn:
+            return set(conn.execute(select(table.c[column]).distinct()).scalars())
     except SQLAlchemyError as e:
         raise SQLAlchemyError(f"An error ocurred while reading the data: {e}")
-    finally:
-        engine.dispose()
-    return df
 
-def full_load(df: pd.DataFrame, table_schema: str,
-                  table_name: str, username: str,
-                  password: str, hostname: str,
-                  port: int, database: str) -> None:
-    conn_string = f"postgresql+psycopg2://{username}:{password}@{hostname}:{port}/{database}"
-    engine = create_engine(conn_string)
+@instrument()
+def delete_rows(table_schema: str,
+                table_name: str,
+                column: str,
+                values: list,
+                config: DatabaseConfig | None = None) -> int:
+    """Deletes the rows whose column is one of the values and returns how many were deleted."""
+    engine = get_engine(config)
     try:
-        # Truncate table before inserting
+        if not values or not inspect(engine).has_table(table_name, schema=table_schema):
+            return 0
+        table = Table(table_name, MetaData(), schema=table_schema, autoload_with=engine)
         with engine.begin() as conn:
-            conn.execute(text(f"TRUNCATE TABLE {table_schema}.{table_name}"))
+            return conn.execute(table.delete().where(table.c[column].in_(list(values)))).rowcount
+    except SQLAlchemyError as e:
+        raise SQLAlchemyError(f"An error ocurred while deleting the data: {e}")
+
+def check_id_type(df: pd.DataFrame, table_id_is_integer: bool | None,
+                  table_schema: str, table_name: str) -> None:
+    """Raises when the IDs of the dataframe and the IDs already in the table are not of the same
+    type (integers of the "hash" mode and hex strings otherwise, see hash_rows). They were written
+    with another ID scheme and would never match, every row would be inserted again.
+
+    Args:
+        df (pd.DataFrame): The dataset, with an id column
+        table_id_is_integer (bool | None): Whether the id column of the table holds integers,
+                                           None when the table does not exist
+        table_schema (str): Schema of the table
+        table_name (str): Name of the table
+    """
+    df_id_is_integer = pd.api.types.is_integer_dtype(df["id"])
+    if table_id_is_integer is not None and table_id_is_integer != df_id_is_integer:
+        id_types = {True: "integers", False: "strings"}
+        raise ValueError(
+            f"Error: The IDs of {table_schema}.{table_name} are {id_types[table_id_is_integer]} and the new ones "
+            f"are {id_types[df_id_is_integer]}, they were written with another ID scheme (see get_id_scheme). "
+            f"Rebuild the table with full_refresh=True instead of inserting into it."
+        )
+
+def _id_is_integer(conn, table_schema: str, table_name: str) -> bool | None:
+    # Type of the id column of the table, None when the table (or the column) does not exist
+    inspector = inspect(conn)
+    if not inspector.has_table(table_name, schema=table_schema):
+        return None
+    id_types = [column["type"] for column in inspector.get_columns(table_name, schema=table_schema) if column["name"] == "id"]
+    return isinstance(id_types[0], Integer) if id_types else None
+
+def copy_insert(table, conn, keys: list[str], data_iter) -> int:
+    """DataFrame.to_sql method that streams the rows of a chunk into PostgreSQL
+    with COPY FROM STDIN instead of sending INSERT statements.
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(data_iter)
+    buffer.seek(0)
+    columns = ", ".join(f'"{key}"' for key in keys)
+    table_name = f'"{table.schema}"."{table.name}"' if table.schema else f'"{table.name}"'
+    with conn.connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table_name} ({columns}) FROM STDIN WITH CSV", buffer)
+        return cursor.rowcount
+
+def bulk_load(df: pd.DataFrame, engine: Engine, table_schema: str,
+              table_name: str, truncate: bool = False,
+              chunksize: int = 50000) -> None:
+    """Loads the dataframe (and its index) into an existing table, chunk by chunk so the
+    memory used is bounded. PostgreSQL uses COPY, any other database (e.g. SQLite)
+    falls back to batched INSERTs.
+
+    Args:
+        df (pd.DataFrame): The dataset
+        engine (Engine): SQLAlchemy engine of the database
+        table_schema (str): Schema of the table
+        table_name (str): Name of the table
+        truncate (bool, optional): Empty the table first, in the same transaction. When its id column
+                                   is not of the type of the new IDs (another ID scheme), the table
+                                   is dropped and created again instead. Defaults to False.
+        chunksize (int, optional): Rows sent per COPY/INSERT. Defaults to 50000.
+    """
+    postgres = engine.dialect.name == "postgresql"
+    with engine.begin() as conn:
+        table_id_is_integer = _id_is_integer(conn, table_schema, table_name) if truncate else None
+        if table_id_is_integer is not None and "id" in df.columns and table_id_is_integer != pd.api.types.is_integer_dtype(df["id"]):
+            # BIGINT <-> TEXT, to_sql creates the table again with the type of the new IDs
+            conn.execute(text(f"DROP TABLE {table_schema}.{table_name}"))
+        elif truncate:
+            if postgres:
+                conn.execute(text(f"TRUNCATE TABLE {table_schema}.{table_name}"))
+            else:
+                conn.execute(text(f"DELETE FROM {table_schema}.{table_name}"))
         df.to_sql(
             name=table_name,
             schema=table_schema,
-            con=engine,
+            con=conn,
             if_exists='append',
-            index=True
+            index=True,
+            chunksize=chunksize,
+            method=copy_insert if postgres else None
         )
+
+@instrument()
+def full_load(df: pd.DataFrame, table_schema: str,
+              table_name: str, config: DatabaseConfig | None = None,
+              chunksize: int = 50000) -> None:
+    engine = get_engine(config)
+    try:
+        # Truncate table before inserting
+        bulk_load(df, engine, table_schema, table_name, truncate=True, chunksize=chunksize)
     except SQLAlchemyError as e:
         raise SQLAlchemyError(f"An error ocurred while inserting the data: {e}")
-    finally:
-        engine.dispose()
 
+def insert_new_rows(df: pd.DataFrame, engine: Engine, table_schema: str,
+                    table_name: str, chunksize: int = 50000) -> tuple[int, int]:
+    """Inserts the rows of the dataframe whose id is not in the table yet. The batch is
+    loaded into a temporary table and the deduplication happens in the database with
+    INSERT ... ON CONFLICT DO NOTHING, backed by a unique index on id (created if needed),
+    so the cost depends on the size of the batch and not on the size of the table.
+
+    Args:
+        df (pd.DataFrame): The dataset, with an id column
+        engine (Engine): SQLAlchemy engine of the database (PostgreSQL or SQLite)
+        table_schema (str): Schema of the table
+        table_name (str): Name of the table
+        chunksize (int, optional): Rows sent per COPY/INSERT. Defaults to 50000.
+
+    Returns:
+        tuple: Number of inserted rows and number of skipped (already existing) rows
+    """
+    postgres = engine.dialect.name == "postgresql"
+    batch_table = f"{table_name}_batch"
+    columns = ", ".join(f'"{column}"' for column in [df.index.name or "index"] + list(df.columns))
+    with engine.begin() as conn:
+        if postgres:
+            conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {table_name}_id_key ON {table_schema}.{table_name} (id)"))
+            conn.execute(text(f"CREATE TEMP TABLE {batch_table} (LIKE {table_schema}.{table_name}) ON COMMIT DROP"))
+        else:
+            conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {table_schema}.{table_name}_id_key ON {table_name} (id)"))
+            conn.execute(text(f"CREATE TEMP TABLE {batch_table} AS SELECT * FROM {table_schema}.{table_name} WHERE 0"))
+        df.to_sql(
+            name=batch_table,
+            con=conn,
+            if_exists='append',
+            index=True,
+            chunksize=chunksize,
+            method=copy_insert if postgres else None
+        )
+        # "WHERE true" avoids the ambiguity between ON CONFLICT and a join in SQLite
+        result = conn.execute(text(
+            f"INSERT INTO {table_schema}.{table_name} ({columns}) "
+            f"SELECT {columns} FROM {batch_table} WHERE true "
+            f"ON CONFLICT (id) DO NOTHING"
+        ))
+        inserted = result.rowcount
+        if not postgres:
+            conn.execute(text(f"DROP TABLE {batch_table}"))
+    return inserted, len(df.index) - inserted
+
+@instrument()
 def incremental_insert(df: pd.DataFrame, table_schema: str,
-                  table_name: str, username: str,
-                  password: str, hostname: str,
-                  port: int, database: str) -> None:
-    conn_string = f"postgresql+psycopg2://{username}:{password}@{hostname}:{port}/{database}"
-    engine = create_engine(conn_string)
+                       table_name: str, config: DatabaseConfig | None = None,
+                       chunksize: int = 50000) -> tuple[int, int]:
+    engine = get_engine(config)
     try:
-        # Read the IDs in the main table and convert the results into a list
-        existing_ids = pd.read_sql_query(
-            f"SELECT id FROM {table_schema}.{table_name}",
-            con=engine
-            )['id'].tolist()
-        df_only_new_records = df[~df['id'].isin(existing_ids)]
-        # Insert if dataframe is not empty
-        if not df_only_new_records.empty:
-            df_only_new_records.to_sql(
-                name=table_name,
-                schema=table_schema,
-                con=engine,
-                if_exists='append',
-                index=True
-            )
+        with engine.connect() as conn:
+            check_id_type(df, _id_is_integer(conn, table_schema, table_name), table_schema, table_name)
+        # Only the records with a new ID are inserted
+        inserted, skipped = insert_new_rows(df, engine, table_schema, table_name, chunksize=chunksize)
     except SQLAlchemyError as e:
         raise SQLAlchemyError(f"An error ocurred while inserting the merged data: {e}")
-    finally:
-        engine.dispose()
+    return inserted, skipped
 
 #################################################################################
 #################################################################################
@@ -0,0 +1,73 @@
+import os
+import threading
+from dataclasses import dataclass
+from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, Engine
+
+
+@dataclass(frozen=True)
+class DatabaseConfig:
+    """Connection settings of the database. It is hashable, so it is also the key of the engine registry.
+    Fields that do not apply to the driver (e.g. the hostname for SQLite) can be None.
+    """
+    username: str | None = "postgres"
+    password: str | None = "postgres"
+    hostname: str | None = "localhost"
+    port: int | None = 5432
+    database: str | None = "ml-fitness-tracker"
+    drivername: str = "postgresql+psycopg2"
+
+    @classmethod
+    def from_env(cls) -> "DatabaseConfig":
+        """Reads the settings from the FITNESS_TRACKER_DB_* environment variables, using the
+        defaults for the ones that are not set.
+        """
+        defaults = cls()
+        return cls(
+            username=os.environ.get("FITNESS_TRACKER_DB_USER", defaults.username),
+            password=os.environ.get("FITNESS_TRACKER_DB_PASSWORD", defaults.password),
+            hostname=os.environ.get("FITNESS_TRACKER_DB_HOST", defaults.hostname),
+            port=int(os.environ.get("FITNESS_TRACKER_DB_PORT", defaults.port)),
+            database=os.environ.get("FITNESS_TRACKER_DB_NAME", defaults.database),
+            drivername=os.environ.get("FITNESS_TRACKER_DB_DRIVER", defaults.drivername)
+        )
+
+    @property
+    def url(self) -> URL:
+        return URL.create(
+            drivername=self.drivername,
+            username=self.username,
+            password=self.password,
+            host=self.hostname,
+            port=self.port,
+            database=self.database
+        )
+
+
+_engines: dict[DatabaseConfig, Engine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(config: DatabaseConfig | None = None) -> Engine:
+    """Returns the engine of the configuration, creating it the first time. Engines are shared
+    by the whole process, so consecutive stages reuse the pooled connections.
+
+    Args:
+        config (DatabaseConfig, optional): Connection settings. Defaults to DatabaseConfig.from_env().
+
+    Returns:
+        Engine: SQLAlchemy engine with a connection pool that checks connections before using them
+    """
+    config = config or DatabaseConfig.from_env()
+    with _engines_lock:
+        if config not in _engines:
+            _engines[config] = create_engine(config.url, pool_pre_ping=True)
+        return _engines[config]
+
+
+def dispose_engines() -> None:
+    """Closes the connections of all the engines in the registry."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
@@ -1,9 +1,19 @@
 from sklearn.decomposition import PCA
 import numpy as np
 import scipy.stats as stats
-from scipy.signal import butter, lfilter, filtfilt
-import copy
+from scipy.signal import butter, lfilter, filtfilt, sosfilt, sosfiltfilt
+from functools import lru_cache
 import pandas as pd
+from .instrumentation_functions import instrument
+
+
+@lru_cache(maxsize=None)
+def butter_lowpass_sos(order, cutoff_frequency, sampling_frequency):
+    # Designed once per (order, cutoff, fs), second-order sections are numerically
+    # more stable than the (b, a) coefficients for higher orders
+    nyq = 0.5 * sampling_frequency
+    return butter(order, cutoff_frequency / nyq, btype="low", output="sos", analog=False)
+
 
 # This class removes the high frequency data (that might be considered noise) from the data.
 # We can only apply this when we do not have missing values (i.e. NaN).
@@ -29,6 +39,64 @@ class LowPassFilter:
             data_table[col + "_lowpass"] = lfilter(b, a, data_table[col])
         return data_table
 
+    # Filters all the columns at once, overwriting them. With group_col every group (e.g. set)
+    # is filtered on its own, so adjacent recordings do not bleed into each other.
+    @instrument()
+    def low_pass_filter_columns(
+        self,
+        data_table,
+        cols,
+        sampling_frequency,
+        cutoff_frequency,
+        order=5,
+        phase_shift=True,
+        group_col=None,
+    ):
+        sos = butter_lowpass_sos(order, float(cutoff_frequency), float(sampling_frequency))
+        # Default padding of sosfiltfilt, shorter segments (e.g. a few seconds at inference
+        # time) are padded as much as they can
+        padlen = 3 * (2 * len(sos) + 1 - min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum()))
+
+        def sos_filter(values):
+            if not phase_shift:
+                return sosfilt(sos, values, axis=0)
+            return sosfiltfilt(sos, values, axis=0, padlen=min(padlen, len(values) - 1))
+
+        values = data_table[cols].to_numpy(dtype=np.float64, copy=True)
+        if group_col is None:
+            values = sos_filter(values)
+        else:
+            # The rows sorted by group once, every group is a contiguous block of the order
+            codes, _ = pd.factorize(data_table[group_col])
+            order = np.argsort(codes, kind="stable")
+            bounds = np.flatnonzero(np.diff(codes[order])) + 1
+            for rows in np.split(order, bounds) if len(order) else []:
+                values[rows] = sos_filter(values[rows])
+        data_table[cols] = values
+        return data_table
+
+
+# Mean and range (max - min) of every column of a 2-D array, in a single pass over the rows:
+# the blocks are small enough to stay in the cache for the three reductions.
+def normalization_parameters(values, block_size=65536):
+    n_rows = len(values)
+    total = np.zeros(values.shape[1])
+    minimum = np.full(values.shape[1], np.inf)
+    maximum = np.full(values.shape[1], -np.inf)
+    for start in range(0, n_rows, block_size):
+        block = values[start : start + block_size]
+        total += block.sum(axis=0, dtype=np.float64)
+        np.minimum(minimum, block.min(axis=0), out=minimum)
+        np.maximum(maximum, block.max(axis=0), out=maximum)
+    return total / n_rows, maximum - minimum
+
+
+# (values - means) / ranges, in place
+def normalize_values(values, means, ranges):
+    values -= means.astype(values.dtype)
+    values /= ranges.astype(values.dtype)
+    return values
+
 
 # Class for Principal Component Analysis. We can only apply this when we do not have missing values (i.e. NaN).
 # For this we have to impute these first, be aware of this.
@@ -40,14 +108,22 @@ class PrincipalComponentAnalysis:
         self.pca = []
 
     def normalize_dataset(self, data_table, columns):
-        dt_norm = copy.deepcopy(data_table)
-        for col in columns:
-            dt_norm[col] = (data_table[col] - data_table[col].mean()) / (
-                data_table[col].max()
-                - data_table[col].min()
-                # data_table[col].std()
-            )
-        return dt_norm
+        """Normalizes the selected columns, (value - mean) / (max - min). They are copied once
+        into a float32 array that is normalized in place, the rest of the table (strings, ids,
+        ...) is never copied. The fitted means and ranges are kept to normalize new data the
+        same way.
+
+        Returns a float32 ndarray with one column per entry of columns, in that order, and not
+        a copy of data_table with the normalized columns like before.
+        """
+        values = data_table[columns].to_numpy(dtype=np.float32, copy=True)
+        self.means, self.ranges = normalization_parameters(values)
+        return normalize_values(values, self.means, self.ranges)
+
+    def transform_dataset(self, data_table, columns):
+        """Normalizes new data with the parameters fitted by normalize_dataset, also as a float32 ndarray."""
+        values = data_table[columns].to_numpy(dtype=np.float32, copy=True)
+        return normalize_values(values, self.means, self.ranges)
 
     # Perform the PCA on the selected columns and return the explained variance.
     def determine_pc_explained_variance(self, data_table, cols):
@@ -57,12 +133,13 @@ class PrincipalComponentAnalysis:
 
         # perform the PCA.
         self.pca = PCA(n_components=len(cols))
-        self.pca.fit(dt_norm[cols])
+        self.pca.fit(dt_norm)
         # And return the explained variances.
         return self.pca.explained_variance_ratio_
 
     # Apply a PCA given the number of components we have selected.
     # We add new pca columns.
+    @instrument()
     def apply_pca(self, data_table, cols, number_comp):
 
         # Normalize the data first.
@@ -70,10 +147,10 @@ class PrincipalComponentAnalysis:
 
         # perform the PCA.
         self.pca = PCA(n_components=number_comp)
-        self.pca.fit(dt_norm[cols])
+        self.pca.fit(dt_norm)
 
         # Transform our old values.
-        new_values = self.pca.transform(dt_norm[cols])
+        new_values = self.pca.transform(dt_norm)
 
         # And add the new ones:
         for comp in range(0, number_comp):
@@ -104,17 +181,56 @@ class NumericalAbstraction:
 
     # Abstract numerical columns specified given a window size (i.e. the number of time points from
     # the past considered) and an aggregation function.
+    @instrument()
     def abstract_numerical(self, data_table, cols, window_size, aggregation_function):
+        return self.abstract_numerical_by_group(
+            data_table, cols, window_size, [aggregation_function]
+        )
+
+    # Same as abstract_numerical, but for several aggregation functions at once and
+    # (optionally) without mixing the history of different groups, e.g. sets.
+    # The pandas rolling kernels are used instead of a Python callback per window:
+    # mean and std are running sums (O(1) per step) and std uses ddof=0 like np.std.
+    @instrument()
+    def abstract_numerical_by_group(
+        self, data_table, cols, window_size, aggregation_functions, group_col=None
+    ):
+        # Work with a positional index, so the results can be put back in the original
+        # row order even when the index has duplicates or the groups are not contiguous.
+        values = data_table[cols].reset_index(drop=True)
+        if group_col is None:
+            rolling = values.rolling(window_size)
+        else:
+            rolling = values.groupby(
+                data_table[group_col].to_numpy(), sort=False
+            ).rolling(window_size)
+
+        results = {}
+        for aggregation_function in aggregation_functions:
+            if aggregation_function == "std":
+                result = rolling.std(ddof=0)
+            elif aggregation_function in ("mean", "max", "min", "median"):
+                result = getattr(rolling, aggregation_function)()
+            else:
+                raise ValueError(
+                    f"Invalid aggregation function '{aggregation_function}'. "
+                    "Correct values are 'mean', 'max', 'min', 'median' or 'std'."
+                )
+            if group_col is not None:
+                result = result.droplevel(0).sort_index()
+            results[aggregation_function] = result
 
-        # Create new columns for the temporal data, pass over the dataset and compute values
+        # Create new columns for the temporal data
+        new_columns = {}
         for col in cols:
-            data_table[
-                col + "_temp_" + aggregation_function + "_ws_" + str(window_size)
-            ] = (
-                data_table[col]
-                .rolling(window_size)
-                .apply(self.aggregate_value(aggregation_function))
-            )
+            for aggregation_function in aggregation_functions:
+                new_columns[
+                    col + "_temp_" + aggregation_function + "_ws_" + str(window_size)
+                ] = results[aggregation_function][col].to_numpy()
+        new_columns = pd.DataFrame(new_columns, index=data_table.index)
+        data_table = pd.concat(
+            [data_table.drop(columns=new_columns.columns, errors="ignore"), new_columns], axis=1
+        )
 
         return data_table
 
@@ -130,46 +246,62 @@ class FourierTransformation:
         transformation = np.fft.rfft(data, len(data))
         return transformation.real, transformation.imag
 
+    # Dominant frequency, weighted frequency and power spectral entropy of the real
+    # amplitudes of one or more windows (frequencies in the last axis).
+    def spectral_features(self, real_ampl, freqs):
+        # We only consider the positive frequencies for now.
+        with np.errstate(divide="ignore", invalid="ignore"):
+            max_freq = freqs[np.argmax(real_ampl, axis=-1)]
+            freq_weighted = np.sum(freqs * real_ampl, axis=-1) / np.sum(real_ampl, axis=-1)
+            PSD = np.divide(np.square(real_ampl), float(real_ampl.shape[-1]))
+            PSD_pdf = np.divide(PSD, np.sum(PSD, axis=-1, keepdims=True))
+            pse = -np.sum(np.log(PSD_pdf) * PSD_pdf, axis=-1)
+        return max_freq, freq_weighted, pse
+
     # Get frequencies over a certain window.
+    @instrument()
     def abstract_frequency(self, data_table, cols, window_size, sampling_rate):
 
         # Create new columns for the frequency data.
         freqs = np.round((np.fft.rfftfreq(int(window_size)) * sampling_rate), 3)
 
-        for col in cols:
-            data_table[col + "_max_freq"] = np.nan
-            data_table[col + "_freq_weighted"] = np.nan
-            data_table[col + "_pse"] = np.nan
-            for freq in freqs:
-                data_table[
-                    col + "_freq_" + str(freq) + "_Hz_ws_" + str(window_size)
-                ] = np.nan
-
-        # Pass over the dataset (we cannot compute it when we do not have enough history)
-        # and compute the values.
-        for i in range(window_size, len(data_table.index)):
-            for col in cols:
-                real_ampl, imag_ampl = self.find_fft_transformation(
-                    data_table[col].iloc[
-                        i - window_size : min(i + 1, len(data_table.index))
-                    ],
-                    sampling_rate,
-                )
-                # We only look at the real part in this implementation.
-                for j in range(0, len(freqs)):
-                    data_table.loc[
-                        i, col + "_freq_" + str(freqs[j]) + "_Hz_ws_" + str(window_size)
-                    ] = real_ampl[j]
-                # And select the dominant frequency. We only consider the positive frequencies for now.
-
-                data_table.loc[i, col + "_max_freq"] = freqs[
-                    np.argmax(real_ampl[0 : len(real_ampl)])
-                ]
-                data_table.loc[i, col + "_freq_weighted"] = float(
-                    np.sum(freqs * real_ampl)
-                ) / np.sum(real_ampl)
-                PSD = np.divide(np.square(real_ampl), float(len(real_ampl)))
-                PSD_pdf = np.divide(PSD, np.sum(PSD))
-                data_table.loc[i, col + "_pse"] = -np.sum(np.log(PSD_pdf) * PSD_pdf)
-
-        return data_table
\ No newline at end of file
+        # Every window covers the rows i - window_size up to and including i, so
+        # there are window_size + 1 samples per window. We cannot compute anything
+        # when we do not have enough history, those rows stay NaN.
+        n_rows = len(data_table.index)
+        n_windows = max(n_rows - window_size, 0)
+        values = data_table[cols].to_numpy(dtype=float)
+        if n_windows > 0:
+            # Strided (zero-copy) view of all the windows with shape (windows, cols, samples)
+            windows = np.lib.stride_tricks.sliding_window_view(
+                values, window_size + 1, axis=0
+            )
+            # We only look at the real part in this implementation.
+            real_ampl = np.ascontiguousarray(np.fft.rfft(windows, axis=-1).real)
+        else:
+            real_ampl = np.empty((0, len(cols), len(freqs)))
+
+        max_freq, freq_weighted, pse = self.spectral_features(real_ampl, freqs)
+
+        # Assemble all the new columns at once, keeping the same column order as
+        # adding them one by one.
+        def pad(window_values):
+            column = np.full(n_rows, np.nan)
+            column[window_size:] = window_values
+            return column
+
+        new_columns = {}
+        for c, col in enumerate(cols):
+            new_columns[col + "_max_freq"] = pad(max_freq[:, c])
+            new_columns[col + "_freq_weighted"] = pad(freq_weighted[:, c])
+            new_columns[col + "_pse"] = pad(pse[:, c])
+            for j in range(0, len(freqs)):
+                new_columns[
+                    col + "_freq_" + str(freqs[j]) + "_Hz_ws_" + str(window_size)
+                ] = pad(real_ampl[:, c, j])
+        new_columns = pd.DataFrame(new_columns, index=data_table.index)
+        data_table = pd.concat(
+            [data_table.drop(columns=new_columns.columns, errors="ignore"), new_columns], axis=1
+        )
+
+        return data_table
@@ -0,0 +1,139 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from .feature_engineering_functions import LowPassFilter, NumericalAbstraction, FourierTransformation
+from .instrumentation_functions import instrument
+
+
+def extract_set_features(data_table: pd.DataFrame,
+                         cols: list[str],
+                         sampling_frequency: float,
+                         cutoff_frequency: float,
+                         rolling_window_size: int,
+                         fft_window_size: int,
+                         phase_shift: bool = True) -> pd.DataFrame:
+    """Lowpass -> scalar magnitudes -> rolling -> frequency features of the sensor data of one set.
+
+    Args:
+        data_table (pd.DataFrame): Sensor data of one set (accelerometer and gyroscope axes)
+        cols (list): Sensor columns, they are overwritten with the lowpass values
+        sampling_frequency (float): Samples per second
+        cutoff_frequency (float): Cutoff frequency of the lowpass filter
+        rolling_window_size (int): Samples in the rolling windows
+        fft_window_size (int): Samples in the frequency windows
+        phase_shift (bool, optional): Zero-phase (forward and backward) filter. False applies the
+                                      causal filter that a live feed can reproduce. Defaults to True.
+
+    Returns:
+        pd.DataFrame: The lowpass sensor columns followed by acc_r, gyr_r and the rolling and frequency features
+    """
+    data_table = data_table[cols].copy()
+
+    # Reducing the noise of each repetition with a Butterworth lowpass filter
+    data_table = LowPassFilter().low_pass_filter_columns(
+        data_table=data_table,
+        cols=cols,
+        sampling_frequency=sampling_frequency,
+        cutoff_frequency=cutoff_frequency,
+        phase_shift=phase_shift
+    )
+
+    # Scalar magnitude of every device, impartial to the device orientation
+    data_table["acc_r"] = np.sqrt(data_table["x_axis_g"] ** 2 + data_table["y_axis_g"] ** 2 + data_table["z_axis_g"] ** 2)
+    data_table["gyr_r"] = np.sqrt(data_table["x_axis_deg_s"] ** 2 + data_table["y_axis_deg_s"] ** 2 + data_table["z_axis_deg_s"] ** 2)
+    feature_columns = cols + ["acc_r", "gyr_r"]
+
+    data_table = NumericalAbstraction().abstract_numerical_by_group(
+        data_table, feature_columns, rolling_window_size, ["mean", "std"]
+    )
+    data_table = FourierTransformation().abstract_frequency(
+        data_table.reset_index(drop=True), feature_columns, fft_window_size, int(sampling_frequency)
+    )
+    return data_table
+
+
+def _extract_shared_set_features(shm_name: str, shape: tuple[int, int], start: int, stop: int,
+                                 cols: list[str], kwargs: dict) -> pd.DataFrame:
+    # The numeric block of every set is read from shared memory instead of being pickled
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # Copy the rows of the set out of the shared block, so it can be closed right away
+        data_table = pd.DataFrame(np.ndarray(shape, dtype=np.float64, buffer=shm.buf)[start:stop], columns=cols, copy=True)
+    finally:
+        shm.close()
+    return extract_set_features(data_table, cols, **kwargs)
+
+
+@instrument()
+def extract_features_by_set(df: pd.DataFrame,
+                            cols: list[str],
+                            sampling_frequency: float,
+                            cutoff_frequency: float,
+                            rolling_window_size: int,
+                            fft_window_size: int,
+                            set_col: str = "set",
+                            max_workers: int | None = None) -> pd.DataFrame:
+    """Runs extract_set_features for every set in a pool of processes. The frame is partitioned
+    once, the sensor values are handed to the workers through shared memory and the results
+    are put back together in the order of the sets (order of first appearance), so the output
+    does not depend on the number of workers.
+
+    Args:
+        df (pd.DataFrame): The dataset
+        cols (list): Sensor columns
+        sampling_frequency (float): Samples per second
+        cutoff_frequency (float): Cutoff frequency of the lowpass filter
+        rolling_window_size (int): Samples in the rolling windows
+        fft_window_size (int): Samples in the frequency windows
+        set_col (str, optional): Column that identifies the sets. Defaults to "set".
+        max_workers (int, optional): Processes in the pool, 1 runs everything in this process.
+                                     Defaults to the number of CPUs.
+
+    Returns:
+        pd.DataFrame: The rows of df grouped by set, with the lowpass sensor columns and the new features (float32)
+    """
+    max_workers = max_workers or os.cpu_count()
+    kwargs = {
+        "sampling_frequency": sampling_frequency,
+        "cutoff_frequency": cutoff_frequency,
+        "rolling_window_size": rolling_window_size,
+        "fft_window_size": fft_window_size
+    }
+    # Make every set a contiguous block of rows
+    codes, _ = pd.factorize(df[set_col])
+    df = df.iloc[np.argsort(codes, kind="stable")]
+    bounds = np.flatnonzero(np.diff(np.sort(codes))) + 1
+    partitions = list(zip(np.r_[0, bounds], np.r_[bounds, len(df.index)])) if len(df.index) else []
+
+    # Both paths work on the same float64 block, so the output does not depend on the path
+    block = np.ascontiguousarray(df[cols].to_numpy(dtype=np.float64))
+    if max_workers == 1 or len(partitions) <= 1:
+        results = [
+            extract_set_features(pd.DataFrame(block[start:stop], columns=cols), cols, **kwargs)
+            for start, stop in partitions
+        ]
+    else:
+        shm = shared_memory.SharedMemory(create=True, size=max(block.nbytes, 1))
+        try:
+            np.ndarray(block.shape, dtype=np.float64, buffer=shm.buf)[:] = block
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(_extract_shared_set_features, shm.name, block.shape, start, stop, cols, kwargs)
+                    for start, stop in partitions
+                ]
+                results = [future.result() for future in futures]
+        finally:
+            shm.close()
+            shm.unlink()
+
+    # Put the features back by position, the index can have duplicates
+    features = pd.concat(results, ignore_index=True) if results else pd.DataFrame(columns=cols)
+    # The features are computed in float64 and stored in float32, like the sensors
+    features = features.astype(np.float32)
+    features.index = df.index
+    new_columns = [column for column in features.columns if column not in cols]
+    df = pd.concat([df.drop(columns=cols), features], axis=1)[list(df.columns) + new_columns]
+    # The frequency features are added one column at a time, consolidate the blocks
+    return df.copy()
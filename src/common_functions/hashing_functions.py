@@ -0,0 +1,61 @@
+import os
+import numpy as np
+import pandas as pd
+from .instrumentation_functions import instrument
+
+# "hash" hashes whole columns at once with pandas' vectorized hashing and is the default,
+# the 64 bits are kept as an int64 (8 bytes per row, a BIGINT column when the table is
+# created or fully loaded with them). "hex" is the same hash as 16 hex characters, the IDs
+# of the tables written before "hash" became an integer. Use "hex" while the existing tables
+# still hold those IDs so they stay deduplicable: inserting IDs of the other type into them
+# is refused (check_id_type) until they are rebuilt with full_refresh.
+ID_MODES = ("hash", "hex")
+DEFAULT_ID_MODE = os.environ.get("FITNESS_TRACKER_ID_MODE", "hash")
+# Version of the rows the IDs are computed from. The sensors are read as float32 and the
+# time columns are dropped since version 2, so the md5 IDs of the tables written before
+# (create_id) can not be reproduced anymore: the same row is a different string. Tables
+# with IDs of another scheme can not be deduplicated against and have to be rebuilt
+# (full_refresh) instead of appended to.
+ID_SCHEME_VERSION = 2
+
+
+def get_id_scheme(mode: str | None = None) -> str:
+    """Name of the IDs produced by hash_rows in this mode (defaults to FITNESS_TRACKER_ID_MODE),
+    two tables only share IDs for the same rows when their schemes are the same.
+    """
+    return f"{mode or DEFAULT_ID_MODE}-v{ID_SCHEME_VERSION}"
+
+
+@instrument()
+def hash_rows(df: pd.DataFrame, mode: str | None = None) -> pd.Series:
+    """Creates an ID for every row of the dataframe based on its values (the index is not used).
+
+    Args:
+        df (pd.DataFrame): The dataset
+        mode (str, optional): "hash" or "hex". Defaults to the FITNESS_TRACKER_ID_MODE
+                              environment variable or "hash" when it is not set.
+
+    Returns:
+        pd.Series: IDs with the same index as the dataframe. int64 in "hash" mode and 16 hex
+        characters in "hex" mode.
+    """
+    mode = mode or DEFAULT_ID_MODE
+    if mode == "md5":
+        raise ValueError(
+            "Error: The md5 IDs of the tables written before ID scheme 2 can not be reproduced from the "
+            "float32 sensors. Rebuild those tables with full_refresh=True instead."
+        )
+    if mode not in ID_MODES:
+        raise ValueError(f"Error: Invalid mode '{mode}'. Correct values are 'hash' or 'hex'.")
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    if mode == "hex":
+        return pd.Series(_uint64_to_hex(hashes), index=df.index, dtype="string")
+    # Same bits, signed so every database can store them
+    return pd.Series(hashes.view(np.int64), index=df.index)
+
+
+def _uint64_to_hex(hashes: np.ndarray) -> np.ndarray:
+    # Hex-encode the big endian bytes of every hash in one go and cut the result
+    # into fixed width strings.
+    hex_bytes = hashes.astype(">u8").tobytes().hex().encode()
+    return np.frombuffer(hex_bytes, dtype="S16").astype("U16")
@@ -0,0 +1,117 @@
+import os
+import joblib
+import numpy as np
+import pandas as pd
+from .data_common_functions import ACCELEROMETER_COLUMNS, SENSOR_COLUMNS
+from .feature_extraction_functions import extract_features_by_set
+from .model_state_functions import DEFAULT_MODEL_DIR, FEATURE_PIPELINE_FILE, FeatureModelState
+from .repetition_functions import count_repetitions
+from .streaming_functions import GYROSCOPE_AXES
+
+CLASSIFIER_FILE = "classifier.joblib"
+
+
+def save_classifier(classifier, feature_names: list[str], model_dir: str = DEFAULT_MODEL_DIR) -> str:
+    """Saves the trained classifier and the features (in order) it expects."""
+    os.makedirs(model_dir, exist_ok=True)
+    path = os.path.join(model_dir, CLASSIFIER_FILE)
+    joblib.dump({"classifier": classifier, "feature_names": feature_names}, path)
+    return path
+
+
+def parse_window(window: dict) -> tuple[np.ndarray, np.ndarray]:
+    """Validates a raw sensor window: {"accelerometer": [[epoch_ms, x, y, z], ...],
+    "gyroscope": [[epoch_ms, x, y, z], ...]} with the MetaWear units (g and deg/s).
+    """
+    arrays = []
+    for sensor in ("accelerometer", "gyroscope"):
+        try:
+            samples = np.asarray(window[sensor], dtype=np.float64)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Error: '{sensor}' must be a list of [epoch_ms, x, y, z] samples.")
+        if samples.ndim != 2 or samples.shape[1] != 4 or len(samples) == 0:
+            raise ValueError(f"Error: '{sensor}' must be a list of [epoch_ms, x, y, z] samples.")
+        arrays.append(samples)
+    return arrays[0], arrays[1]
+
+
+class InferenceModel:
+    """The feature pipeline of build_features (lowpass, rolling, frequency and the fitted
+    FeatureModelState) and the classifier of train_model, loaded once. predict transforms
+    and classifies a batch of windows with one call of every step.
+    """
+
+    def __init__(self, feature_state: FeatureModelState, classifier: dict):
+        self.params = feature_state.params
+        self.feature_state = feature_state
+        self.classifier = classifier["classifier"]
+        self.feature_names = classifier["feature_names"]
+        self.bin_ms = pd.Timedelta(self.params["time_rule"]) // pd.Timedelta("1ms")
+        self.sampling_frequency = pd.Timedelta("1s") / pd.Timedelta(self.params["time_rule"])
+
+    @classmethod
+    def load(cls, model_dir: str = DEFAULT_MODEL_DIR) -> "InferenceModel":
+        return cls(
+            FeatureModelState.load(os.path.join(model_dir, FEATURE_PIPELINE_FILE)),
+            joblib.load(os.path.join(model_dir, CLASSIFIER_FILE))
+        )
+
+    def _resample(self, samples: list[np.ndarray], columns: list[str]) -> pd.DataFrame:
+        # Mean of every bin of every window, like merge_sensor_data (the sensors are float32)
+        values = np.concatenate(samples)
+        df = pd.DataFrame(values[:, 1:].astype(np.float32), columns=columns)
+        df["set"] = np.repeat(np.arange(len(samples)), [len(window) for window in samples])
+        epoch_ms = values[:, 0].astype(np.int64)
+        df["bin"] = epoch_ms - epoch_ms % self.bin_ms
+        return df.groupby(["set", "bin"], sort=True).mean()
+
+    def predict(self, windows: list[tuple[np.ndarray, np.ndarray]]) -> list[dict]:
+        """Predicts the exercise and the repetitions of every window (parsed with parse_window).
+
+        Returns:
+            list: {"label", "probability", "reps"} of every window, label is None when the window
+            is shorter than the frequency window (fft_window_size + 1 resampled samples) or its
+            sensors do not have samples in the same time bins
+        """
+        df = self._resample([acc for acc, _ in windows], ACCELEROMETER_COLUMNS).join(
+            self._resample([gyr for _, gyr in windows], GYROSCOPE_AXES), how="inner"
+        ).reset_index()
+        df = df[SENSOR_COLUMNS + ["set"]]
+        results = [{"label": None, "probability": None, "reps": None} for _ in windows]
+        # No window has a bin with samples of both sensors
+        if df.empty:
+            return results
+
+        df_features = extract_features_by_set(
+            df,
+            SENSOR_COLUMNS,
+            sampling_frequency=self.sampling_frequency,
+            cutoff_frequency=self.params["cutoff"],
+            rolling_window_size=self.params["rolling_window_size"],
+            fft_window_size=self.params["fft_window_size"],
+            max_workers=1
+        )
+        df_features = self.feature_state.transform(df_features)
+        # The first rows of every window do not have enough history for the features
+        df_features = df_features.dropna(subset=self.feature_names)
+
+        if df_features.empty:
+            return results
+        # The label of a window is the one with the highest mean probability over its rows
+        probabilities = pd.DataFrame(
+            self.classifier.predict_proba(df_features[self.feature_names].to_numpy(dtype=np.float32)),
+            columns=self.classifier.classes_
+        ).groupby(df_features["set"].to_numpy()).mean()
+        labels = probabilities.idxmax(axis=1)
+
+        df["label"] = df["set"].map(labels)
+        reps = count_repetitions(df[df["label"].notna()], sampling_frequency=self.sampling_frequency)
+        reps = dict(zip(reps["set"], reps["reps"]))
+        for window, label in labels.items():
+            results[window] = {
+                "label": label,
+                "probability": float(probabilities.loc[window, label]),
+                # Labels without a repetition preset (rest) do not have repetitions
+                "reps": int(reps.get(window, 0))
+            }
+        return results
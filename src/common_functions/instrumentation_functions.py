@@ -0,0 +1,228 @@
+import cProfile
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from collections.abc import Iterator
+import pandas as pd
+
+# JSON lines file the metrics are appended to ("-" writes them to stderr). Nothing is
+# measured when it is not set, so the instrumented functions cost one lookup.
+METRICS_ENV = "FITNESS_TRACKER_METRICS"
+# "1" also traces the allocations of Python and numpy (tracemalloc) to get the peak of every
+# call. It is opt-in because it makes pandas heavy code about 3 times slower.
+TRACE_MEMORY_ENV = "FITNESS_TRACKER_TRACE_MEMORY"
+# Comma separated names of the calls to profile with cProfile, e.g. "stage.features"
+PROFILE_ENV = "FITNESS_TRACKER_PROFILE"
+PROFILE_DIR_ENV = "FITNESS_TRACKER_PROFILE_DIR"
+DEFAULT_PROFILE_DIR = str(Path(__file__).parent.parent.parent.joinpath("profiles"))
+
+
+class CallMetrics:
+    """Metrics of one instrumented call. rows_out can be set inside a track block."""
+
+    def __init__(self, name: str, rows_in: int | None = None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.peak_bytes = 0
+        self.peak_rss_bytes = 0
+        self.profile_path = None
+
+
+# Calls in progress in this process, the innermost last
+_stack: list[CallMetrics] = []
+_profiling = False
+
+
+def _reset_after_fork() -> None:
+    # The workers of a pool do not run inside the calls of the parent
+    global _profiling
+    _stack.clear()
+    _profiling = False
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def count_rows(value) -> int | None:
+    """Rows of a DataFrame or Series, or the sum over a tuple/list of them (None otherwise)."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value.index)
+    if isinstance(value, (tuple, list)):
+        counts = [count_rows(item) for item in value if isinstance(item, (pd.DataFrame, pd.Series))]
+        return sum(counts) if counts else None
+    return None
+
+
+def _read_rss() -> tuple[int, int] | None:
+    """Current and peak RSS of this process in bytes (VmRSS and VmHWM), None when /proc is not there."""
+    try:
+        with open("/proc/self/status") as f:
+            status = dict(line.split(":", 1) for line in f if line.startswith(("VmRSS", "VmHWM")))
+        return int(status["VmRSS"].split()[0]) * 1024, int(status["VmHWM"].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _reset_peak_rss() -> bool:
+    """Sets the peak RSS of this process back to its current RSS (Linux), so the next peak is
+    the one of the call that starts. Returns False when it is not supported.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _write_record(path: str, record: dict) -> None:
+    line = json.dumps(record) + "\n"
+    if path == "-":
+        sys.stderr.write(line)
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(line)
+
+
+def _start_profile(metrics: CallMetrics) -> cProfile.Profile | None:
+    global _profiling
+    names = {name.strip() for name in os.environ.get(PROFILE_ENV, "").split(",")}
+    if _profiling or metrics.name not in names:
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler (e.g. python -m cProfile) is already active
+        return None
+    _profiling = True
+    return profiler
+
+
+def _stop_profile(metrics: CallMetrics, profiler: cProfile.Profile) -> None:
+    global _profiling
+    profiler.disable()
+    _profiling = False
+    profile_dir = os.environ.get(PROFILE_DIR_ENV, DEFAULT_PROFILE_DIR)
+    os.makedirs(profile_dir, exist_ok=True)
+    metrics.profile_path = os.path.join(profile_dir, f"{metrics.name}-{os.getpid()}-{time.strftime('%Y%m%dT%H%M%S')}.prof")
+    profiler.dump_stats(metrics.profile_path)
+
+
+@contextmanager
+def track(name: str, rows_in: int | None = None) -> Iterator[CallMetrics]:
+    """Measures the block: wall time, CPU time (of this process), rows in/out, the peak RSS of
+    this process during the block (peak_rss_mb) and how far it went above the RSS at the start
+    (peak_rss_increase_mb), and with FITNESS_TRACKER_TRACE_MEMORY=1 the peak of the memory
+    allocated by Python and numpy (tracemalloc) above what was allocated at the start. The
+    RSS peaks need Linux, where the peak of the process can be reset (they are None elsewhere),
+    and do not include worker processes. The metrics are written as one JSON line to
+    FITNESS_TRACKER_METRICS when the block ends, and the block is profiled when its name is
+    in FITNESS_TRACKER_PROFILE.
+
+    Args:
+        name (str): Name of the block in the metrics, e.g. "stage.features"
+        rows_in (int, optional): Rows the block receives. Defaults to None.
+
+    Yields:
+        CallMetrics: Set rows_out on it to record the rows the block produces
+    """
+    metrics = CallMetrics(name, rows_in)
+    path = os.environ.get(METRICS_ENV)
+    if not path:
+        yield metrics
+        return
+
+    trace_memory = os.environ.get(TRACE_MEMORY_ENV) == "1"
+    if trace_memory:
+        # Tracing stays on for the rest of the process: stopping it while other threads (the
+        # pool managers, pyarrow) still allocate can crash the interpreter
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # tracemalloc keeps a single peak, so the peak reached so far by the enclosing call is
+        # saved before it is reset for this one. The enclosing call keeps the max of both.
+        if _stack:
+            _stack[-1].peak_bytes = max(_stack[-1].peak_bytes, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        start_bytes = tracemalloc.get_traced_memory()[0]
+    # The peak RSS is reset the same way, the enclosing call saves the peak it reached so far
+    if _stack:
+        _stack[-1].peak_rss_bytes = max(_stack[-1].peak_rss_bytes, (_read_rss() or (0, 0))[1])
+    start_rss = _read_rss() if _reset_peak_rss() else None
+    parent = _stack[-1].name if _stack else None
+    _stack.append(metrics)
+    profiler = _start_profile(metrics)
+    status = "ok"
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    try:
+        yield metrics
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        wall_seconds = time.perf_counter() - start_wall
+        cpu_seconds = time.process_time() - start_cpu
+        if profiler is not None:
+            _stop_profile(metrics, profiler)
+        _stack.pop()
+        peak_traced_mb = None
+        if trace_memory:
+            peak_bytes = max(metrics.peak_bytes, tracemalloc.get_traced_memory()[1])
+            peak_traced_mb = round(max(peak_bytes - start_bytes, 0) / 2 ** 20, 3)
+            # The peaks this call saved before its own inner calls reset them are also the
+            # enclosing call's, the next reset would lose them otherwise
+            if _stack:
+                _stack[-1].peak_bytes = max(_stack[-1].peak_bytes, peak_bytes)
+        peak_rss_mb = peak_rss_increase_mb = None
+        end_rss = _read_rss() if start_rss is not None else None
+        if end_rss is not None:
+            peak_rss_bytes = max(metrics.peak_rss_bytes, end_rss[1])
+            peak_rss_mb = round(peak_rss_bytes / 2 ** 20, 1)
+            peak_rss_increase_mb = round(max(peak_rss_bytes - start_rss[0], 0) / 2 ** 20, 1)
+            if _stack:
+                _stack[-1].peak_rss_bytes = max(_stack[-1].peak_rss_bytes, peak_rss_bytes)
+        _write_record(path, {
+            "name": name,
+            "parent": parent,
+            "status": status,
+            "timestamp": time.time(),
+            "pid": os.getpid(),
+            "wall_seconds": round(wall_seconds, 6),
+            "cpu_seconds": round(cpu_seconds, 6),
+            "rows_in": metrics.rows_in,
+            "rows_out": metrics.rows_out,
+            "peak_rss_mb": peak_rss_mb,
+            "peak_rss_increase_mb": peak_rss_increase_mb,
+            "peak_traced_mb": peak_traced_mb,
+            "profile": metrics.profile_path
+        })
+
+
+def instrument(name: str | None = None):
+    """Decorator version of track. rows_in are the rows of the DataFrame arguments and rows_out
+    the rows of the returned DataFrame(s).
+
+    Args:
+        name (str, optional): Name in the metrics. Defaults to the qualified name of the function.
+    """
+    def decorator(func):
+        call_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not os.environ.get(METRICS_ENV):
+                return func(*args, **kwargs)
+            rows_in = count_rows([*args, *kwargs.values()])
+            with track(call_name, rows_in=rows_in) as metrics:
+                result = func(*args, **kwargs)
+                metrics.rows_out = count_rows(result)
+            return result
+        return wrapper
+    return decorator
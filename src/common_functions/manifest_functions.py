@@ -0,0 +1,141 @@
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from hashlib import md5
+from pathlib import Path
+
+DEFAULT_MANIFEST_PATH = str(Path(__file__).parent.parent.parent.joinpath("ingest_manifest.sqlite"))
+
+# The accelerometer and the gyroscope files of the same recording only differ in this part
+SENSOR_PATTERN = re.compile(r"_(Accelerometer|Gyroscope)_[0-9.]+Hz")
+
+
+def get_recording_key(file_path: str) -> str:
+    """Name shared by the accelerometer and gyroscope files of a recording, e.g.
+    'A-bench-heavy2-rpe8_MetaWear_2019-01-11T16.10.08.270_C42732BE255C_1.4.4.csv'
+    """
+    return SENSOR_PATTERN.sub("", os.path.basename(file_path))
+
+
+def is_sensor_file(file_path: str) -> bool:
+    """Whether the file is an accelerometer or a gyroscope recording."""
+    return SENSOR_PATTERN.search(os.path.basename(file_path)) is not None
+
+
+def get_file_hash(file_path: str, chunk_size: int = 1 << 20) -> str:
+    file_hash = md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+class FileManifest:
+    """Local SQLite record of the files that were already loaded into the staging tables.
+
+    Every recording (accelerometer + gyroscope file pair) gets a set number the first time
+    it is seen and keeps it forever, so adding files does not renumber the existing sets.
+    """
+
+    def __init__(self, path: str = DEFAULT_MANIFEST_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS recordings (
+                    recording TEXT PRIMARY KEY,
+                    set_number INTEGER NOT NULL UNIQUE
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    recording TEXT NOT NULL REFERENCES recordings (recording),
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    row_count INTEGER NOT NULL,
+                    loaded_at TEXT NOT NULL
+                )"""
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            # Commits on success and rolls back on error
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def is_empty(self) -> bool:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM files").fetchone()[0] == 0
+
+    def get_new_files(self, files_list: list[str], loaded_filenames: set[str] | None = None) -> list[str]:
+        """Returns the files that are not in the manifest or whose content changed since they were loaded.
+
+        Args:
+            files_list (list): File paths
+            loaded_filenames (set, optional): Names of the files the tables actually hold. The files
+                                              that are not among them are new even when the manifest
+                                              has them (e.g. another backend or emptied tables).
+                                              Defaults to trusting the manifest.
+        """
+        with self._connect() as conn:
+            loaded = {
+                path: (size, mtime, content_hash)
+                for path, size, mtime, content_hash in conn.execute(
+                    "SELECT path, size, mtime, content_hash FROM files"
+                )
+            }
+        new_files = []
+        for file_path in files_list:
+            path = os.path.abspath(file_path)
+            if path not in loaded or (loaded_filenames is not None and os.path.basename(path) not in loaded_filenames):
+                new_files.append(file_path)
+                continue
+            size, mtime, content_hash = loaded[path]
+            stat = os.stat(path)
+            # Only hash the file when the cheap checks say it might have changed
+            if (stat.st_size, stat.st_mtime) != (size, mtime) and get_file_hash(path) != content_hash:
+                new_files.append(file_path)
+        return new_files
+
+    def assign_set_numbers(self, files_list: list[str]) -> dict[str, int]:
+        """Returns the set number of every file, numbering the recordings that were not seen before
+        after the existing ones (in name order so the numbering is deterministic).
+        """
+        recordings = {file_path: get_recording_key(file_path) for file_path in files_list}
+        with self._connect() as conn:
+            set_numbers = dict(conn.execute("SELECT recording, set_number FROM recordings"))
+            last_set = max(set_numbers.values(), default=0)
+            for recording in sorted(set(recordings.values()) - set(set_numbers)):
+                last_set += 1
+                set_numbers[recording] = last_set
+                conn.execute(
+                    "INSERT INTO recordings (recording, set_number) VALUES (?, ?)",
+                    (recording, last_set)
+                )
+        return {file_path: set_numbers[recording] for file_path, recording in recordings.items()}
+
+    def mark_loaded(self, row_counts: dict[str, int]) -> None:
+        """Records the files (path -> number of rows) as loaded."""
+        loaded_at = datetime.now(timezone.utc).isoformat()
+        records = []
+        for file_path, row_count in row_counts.items():
+            path = os.path.abspath(file_path)
+            stat = os.stat(path)
+            records.append((
+                path, get_recording_key(path), stat.st_size, stat.st_mtime,
+                get_file_hash(path), row_count, loaded_at
+            ))
+        with self._connect() as conn:
+            conn.executemany(
+                """INSERT OR REPLACE INTO files
+                   (path, recording, size, mtime, content_hash, row_count, loaded_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                records
+            )
@@ -0,0 +1,173 @@
+import json
+import os
+from hashlib import md5
+from pathlib import Path
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import IncrementalPCA
+from .feature_engineering_functions import normalization_parameters, normalize_values
+from .instrumentation_functions import instrument
+from .storage_functions import StorageBackend
+
+DEFAULT_MODEL_DIR = str(Path(__file__).parent.parent.parent.joinpath("models"))
+FEATURE_PIPELINE_FILE = "feature_pipeline.joblib"
+# Version of the clean.fitness_tracker written by build_features, per storage backend
+FEATURES_VERSION_FILE = "features_version.json"
+
+
+def _features_version_path(model_dir: str) -> str:
+    return os.path.join(model_dir, FEATURES_VERSION_FILE)
+
+
+def clear_features_version(model_dir: str = DEFAULT_MODEL_DIR) -> None:
+    """Forgets the version of the features table, e.g. before it is written again."""
+    if os.path.exists(_features_version_path(model_dir)):
+        os.remove(_features_version_path(model_dir))
+
+
+def save_features_version(storage: StorageBackend, df: pd.DataFrame, model_dir: str = DEFAULT_MODEL_DIR) -> str:
+    """Records the fingerprint of the features table that was just written to the backend
+    (its columns and the values of every row).
+
+    Returns:
+        str: The fingerprint
+    """
+    fingerprint = md5(json.dumps(list(df.columns)).encode())
+    fingerprint.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    os.makedirs(model_dir, exist_ok=True)
+    with open(_features_version_path(model_dir), "w") as f:
+        json.dump({"storage": storage.identity, "fingerprint": fingerprint.hexdigest()}, f, indent=2)
+    return fingerprint.hexdigest()
+
+
+def get_features_version(storage: StorageBackend, model_dir: str = DEFAULT_MODEL_DIR) -> str | None:
+    """Fingerprint of the features table build_features last wrote to this backend, None when
+    it is not known (never built here, built for another backend or being rebuilt).
+    """
+    if not os.path.exists(_features_version_path(model_dir)):
+        return None
+    with open(_features_version_path(model_dir)) as f:
+        version = json.load(f)
+    return version["fingerprint"] if version.get("storage") == storage.identity else None
+
+
+def get_set_fingerprints(df: pd.DataFrame, set_col: str = "set", id_col: str = "id") -> dict:
+    """Fingerprint of the rows of every set: the sum of the hashes of their IDs, which changes
+    when a row of the set is added, removed or gets other values (the IDs are row hashes).
+    """
+    hashes = pd.util.hash_pandas_object(df[id_col], index=False).to_numpy()
+    codes, sets = pd.factorize(df[set_col])
+    order = np.argsort(codes, kind="stable")
+    starts = np.r_[0, np.flatnonzero(np.diff(codes[order])) + 1] if len(order) else np.array([], dtype=np.int64)
+    # uint64 sums wrap around, the order of the rows does not matter
+    sums = np.add.reduceat(hashes[order], starts) if len(order) else []
+    return {sets[code]: int(total) for code, total in zip(codes[order][starts], sums) if code >= 0}
+
+
+class FeatureModelState:
+    """The normalization, PCA and clustering of build_features, fitted once and then updated
+    with the sets they have not seen yet (IncrementalPCA and MiniBatchKMeans.partial_fit),
+    so new data only needs a transform and a predict.
+
+    The PCA keeps all the components, the first n_components are the pca_<n> features and
+    explained_variance_ratio_ of all of them is what the elbow method needs. The fingerprints
+    of the sets it has seen are kept too: the models can not forget rows, so when the rows
+    of a seen set change upstream they are fitted again from scratch.
+    """
+
+    def __init__(self, params: dict, cols: list[str], n_components: int,
+                 cluster_cols: list[str], n_clusters: int, random_state: int = 0):
+        self.params = params
+        self.cols = list(cols)
+        self.n_components = n_components
+        self.cluster_cols = list(cluster_cols)
+        self.pca = IncrementalPCA(n_components=len(self.cols))
+        self.kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state, n_init=1)
+        self.means = None
+        self.ranges = None
+        self.seen_sets: set = set()
+        self.set_fingerprints: dict = {}
+
+    @classmethod
+    def load(cls, path: str = os.path.join(DEFAULT_MODEL_DIR, FEATURE_PIPELINE_FILE)) -> "FeatureModelState":
+        return joblib.load(path)
+
+    @classmethod
+    def load_or_create(cls, params: dict, path: str = os.path.join(DEFAULT_MODEL_DIR, FEATURE_PIPELINE_FILE),
+                       refit: bool = False, set_fingerprints: dict | None = None, **kwargs) -> "FeatureModelState":
+        """Returns the persisted state when it was fitted with the same params and the sets it has
+        seen still have the same rows (and refit is not set), otherwise a new unfitted state.
+
+        Args:
+            params (dict): Parameters of the features the models are fitted on
+            path (str, optional): Persisted state. Defaults to <DEFAULT_MODEL_DIR>/FEATURE_PIPELINE_FILE.
+            refit (bool, optional): Always return a new state. Defaults to False.
+            set_fingerprints (dict, optional): get_set_fingerprints of the data the state will be updated
+                                               with. Defaults to None, the rows are assumed to be the same.
+        """
+        if not refit and os.path.exists(path):
+            state = cls.load(path)
+            if isinstance(state, cls) and state.params == params and (
+                set_fingerprints is None or state.has_same_sets(set_fingerprints)
+            ):
+                return state
+        return cls(params, **kwargs)
+
+    def has_same_sets(self, set_fingerprints: dict) -> bool:
+        """Whether every set the models have seen has the same fingerprint in set_fingerprints."""
+        # States saved before the fingerprints were kept do not have them
+        seen_fingerprints = getattr(self, "set_fingerprints", {})
+        return all(
+            seen_set in seen_fingerprints and set_fingerprints.get(seen_set) == seen_fingerprints[seen_set]
+            for seen_set in self.seen_sets
+        )
+
+    def save(self, path: str = os.path.join(DEFAULT_MODEL_DIR, FEATURE_PIPELINE_FILE)) -> str:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        joblib.dump(self, path)
+        return path
+
+    def _normalized(self, data_table: pd.DataFrame) -> np.ndarray:
+        # Only the PCA columns, copied once to float32 and normalized in place
+        return normalize_values(data_table[self.cols].to_numpy(dtype=np.float32, copy=True), self.means, self.ranges)
+
+    @instrument()
+    def partial_fit(self, df: pd.DataFrame, set_col: str = "set", set_fingerprints: dict | None = None) -> int:
+        """Updates the models with the rows of the sets that were not seen before.
+
+        Args:
+            df (pd.DataFrame): The features
+            set_col (str, optional): Column with the set of every row. Defaults to "set".
+            set_fingerprints (dict, optional): get_set_fingerprints of the sets of df, kept for the new sets.
+
+        Returns:
+            int: Number of new sets
+        """
+        df_new = df[~df[set_col].isin(self.seen_sets)].dropna(subset=self.cols)
+        new_sets = set(df_new[set_col].unique())
+        if not new_sets:
+            return 0
+        if self.means is None:
+            # The scale is fixed by the first fit, the PCA follows the drift of the mean
+            self.means, self.ranges = normalization_parameters(df_new[self.cols].to_numpy(dtype=np.float32))
+        self.pca.partial_fit(self._normalized(df_new))
+        self.kmeans.partial_fit(df_new[self.cluster_cols].to_numpy(dtype=np.float32))
+        self.seen_sets |= new_sets
+        if set_fingerprints is not None:
+            self.set_fingerprints.update({new_set: set_fingerprints.get(new_set) for new_set in new_sets})
+        return len(new_sets)
+
+    @property
+    def explained_variance_ratio_(self) -> np.ndarray:
+        return self.pca.explained_variance_ratio_
+
+    @instrument()
+    def transform(self, data_table: pd.DataFrame) -> pd.DataFrame:
+        """Adds the pca_<n> and cluster columns to data_table."""
+        components = self.pca.transform(self._normalized(data_table))
+        for comp in range(0, self.n_components):
+            data_table["pca_" + str(comp + 1)] = components[:, comp]
+        data_table["cluster"] = self.kmeans.predict(data_table[self.cluster_cols].to_numpy(dtype=np.float32))
+        return data_table
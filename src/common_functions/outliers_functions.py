@@ -1,9 +1,11 @@
 import pandas as pd
 import matplotlib.pyplot as plt
-import scipy
+import scipy.special
 import math
 from sklearn.neighbors import LocalOutlierFactor
+from .instrumentation_functions import instrument
 
+@instrument()
 def mark_outliers_iqr(dataset: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
     """Function to mark values as outliers using the IQR method.
 
@@ -32,6 +34,7 @@ def mark_outliers_iqr(dataset: pd.DataFrame, columns: list[str]) -> pd.DataFrame
 
     return dataset
 
+@instrument()
 def mark_outliers_chauvenet(dataset: pd.DataFrame, columns: list[str], C: int=2) -> pd.DataFrame:
     """Finds outliers in the specified column of datatable and adds a binary column with
     the same name extended with '_outlier' that expresses the result per data point.
@@ -51,32 +54,61 @@ def mark_outliers_chauvenet(dataset: pd.DataFrame, columns: list[str], C: int=2)
 
     dataset = dataset.copy()
     for col in columns:
-        # Compute the mean and standard deviation.
-        mean = dataset[col].mean()
-        std = dataset[col].std()
-        N = len(dataset.index)
-        criterion = 1.0 / (C * N)
-
-        # Consider the deviation for the data points.
-        deviation = abs(dataset[col] - mean) / std
-
-        # Express the upper and lower bounds.
-        low = -deviation / math.sqrt(C)
-        high = deviation / math.sqrt(C)
-        prob = []
-        mask = []
-
-        # Pass all rows in the dataset.
-        for i in range(0, len(dataset.index)):
-            # Determine the probability of observing the point
-            prob.append(
-                1.0 - 0.5 * (scipy.special.erf(high[i]) - scipy.special.erf(low[i]))
-            )
-            # And mark as an outlier when the probability is below our criterion.
-            mask.append(prob[i] < criterion)
-        dataset[col + "_outlier"] = mask
+        dataset[col + "_outlier"] = _chauvenet_mask(
+            values=dataset[col],
+            mean=dataset[col].mean(),
+            std=dataset[col].std(),
+            N=len(dataset.index),
+            C=C
+        )
     return dataset
 
+@instrument()
+def remove_outliers_chauvenet(dataset: pd.DataFrame, columns: list[str], group_col: str, C: int=2) -> pd.DataFrame:
+    """Applies Chauvenet's criterion separately to every group (e.g. every label) of the
+    dataset, for all the columns in one vectorized pass, and replaces the outliers with NaN.
+
+    Args:
+        dataset (pd.DataFrame): The dataset
+        columns (list): The columns you want apply outlier detection to
+        group_col (str): Column used to group the data, the mean and standard deviation
+                         are computed within each group
+        C (int, optional): Degree of certainty for the identification of outliers given the assumption 
+                           of a normal distribution, typicaly between 1 - 10. Defaults to 2.
+
+    Returns:
+        pd.DataFrame: A copy of the dataframe where the outliers are replaced by NaN.
+    """
+
+    dataset = dataset.copy()
+    grouped = dataset.groupby(group_col, observed=True)
+    mask = _chauvenet_mask(
+        values=dataset[columns],
+        mean=grouped[columns].transform("mean"),
+        std=grouped[columns].transform("std"),
+        N=grouped[group_col].transform("size").to_numpy()[:, None],
+        C=C
+    )
+    dataset[columns] = dataset[columns].mask(mask)
+    return dataset
+
+def _chauvenet_mask(values, mean, std, N, C: int):
+    """Boolean mask of the values that are outliers according to Chauvenet's criterion."""
+    criterion = 1.0 / (C * N)
+
+    # Consider the deviation for the data points.
+    deviation = abs(values - mean) / std
+
+    # Express the upper and lower bounds.
+    low = -deviation / math.sqrt(C)
+    high = deviation / math.sqrt(C)
+
+    # Determine the probability of observing the point
+    prob = 1.0 - 0.5 * (scipy.special.erf(high) - scipy.special.erf(low))
+    # And mark as an outlier when the probability is below our criterion.
+    return prob < criterion
+
+@instrument()
 def mark_outliers_lof(dataset: pd.DataFrame, columns: list[str], n=20) -> pd.DataFrame:
     """Mark values as outliers using LOF
 
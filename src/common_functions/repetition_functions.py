@@ -0,0 +1,157 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from scipy.signal import find_peaks, sosfilt, sosfilt_zi
+from .data_common_functions import ACCELEROMETER_COLUMNS, SENSOR_COLUMNS
+from .feature_engineering_functions import LowPassFilter, butter_lowpass_sos
+from .instrumentation_functions import instrument
+from .streaming_functions import GYROSCOPE_AXES
+
+
+@dataclass(frozen=True)
+class RepPreset:
+    """How the repetitions of an exercise are found: the signal (acc_r, gyr_r or a sensor
+    column), the lowpass filter that leaves roughly one oscillation per repetition and
+    the minimum prominence of the peaks of the filtered signal.
+    """
+    column: str = "acc_r"
+    cutoff: float = 0.4
+    prominence: float = 0.01
+    order: int = 10
+
+
+# Tuned on the heavy and medium sets of fitness_data
+REP_PRESETS = {
+    "bench": RepPreset(column="acc_r", cutoff=0.45, prominence=0.01),
+    "squat": RepPreset(column="acc_r", cutoff=0.4, prominence=0.01),
+    "dead": RepPreset(column="gyr_r", cutoff=0.4, prominence=1.0),
+    "ohp": RepPreset(column="acc_r", cutoff=0.45, prominence=0.01),
+    "row": RepPreset(column="gyr_r", cutoff=0.65, prominence=1.0)
+}
+
+# The sets of the recordings are 5 repetitions (heavy) or 10 (medium)
+EXPECTED_REPS = {"heavy": 5, "medium": 10}
+
+
+def get_rep_signal(df: pd.DataFrame, column: str) -> np.ndarray:
+    """Values of column, computing the scalar magnitudes acc_r and gyr_r when they are not there."""
+    if column in df.columns:
+        return df[column].to_numpy(dtype=np.float64)
+    if column == "acc_r":
+        return np.sqrt(np.sum(df[ACCELEROMETER_COLUMNS].to_numpy(dtype=np.float64) ** 2, axis=1))
+    if column == "gyr_r":
+        return np.sqrt(np.sum(df[GYROSCOPE_AXES].to_numpy(dtype=np.float64) ** 2, axis=1))
+    raise ValueError(f"Error: Invalid repetition signal '{column}'. Correct values are 'acc_r', 'gyr_r' or a column of the data.")
+
+
+@instrument()
+def count_repetitions(df: pd.DataFrame,
+                      sampling_frequency: float = 5.0,
+                      presets: dict[str, RepPreset] | None = None,
+                      set_col: str = "set",
+                      label_col: str = "label") -> pd.DataFrame:
+    """Counts the repetitions of every set. The sets of each exercise are filtered together
+    (every set on its own) and their peaks are found with a single find_peaks call over all
+    of them, with infinite separators so no peak or prominence crosses two sets.
+
+    Args:
+        df (pd.DataFrame): Resampled sensor data ordered by time, with the set and label columns
+        sampling_frequency (float, optional): Samples per second. Defaults to 5.0 (200ms).
+        presets (dict, optional): Preset of every label. Defaults to REP_PRESETS. Labels without
+                                  a preset (e.g. rest) are not counted.
+        set_col (str, optional): Column that identifies the sets. Defaults to "set".
+        label_col (str, optional): Column with the exercise. Defaults to "label".
+
+    Returns:
+        pd.DataFrame: One row per set with its label and the number of repetitions (reps)
+    """
+    presets = presets or REP_PRESETS
+    results = []
+    for label, preset in presets.items():
+        df_label = df[df[label_col] == label]
+        if df_label.empty:
+            continue
+        # Make every set a contiguous block of rows
+        codes, sets = pd.factorize(df_label[set_col])
+        order = np.argsort(codes, kind="stable")
+        signal = pd.DataFrame({"signal": get_rep_signal(df_label, preset.column)[order], "set": codes[order]})
+        signal = LowPassFilter().low_pass_filter_columns(
+            signal, ["signal"], sampling_frequency, preset.cutoff, order=preset.order, group_col="set"
+        )
+
+        # One separator before every set, its position is the start of the set in the joined signal
+        set_sizes = np.bincount(codes, minlength=len(sets))
+        starts = np.r_[0, np.cumsum(set_sizes)[:-1]]
+        joined = np.insert(signal["signal"].to_numpy(), starts, np.inf)
+        joined = np.append(joined, np.inf)
+        peaks, _ = find_peaks(joined, prominence=preset.prominence)
+        # The separators are peaks of infinite height, they are not repetitions
+        peaks = peaks[np.isfinite(joined[peaks])]
+        separators = starts + np.arange(len(starts))
+        reps = np.bincount(np.searchsorted(separators, peaks, side="right") - 1, minlength=len(sets))
+        results.append(pd.DataFrame({set_col: sets, label_col: label, "reps": reps}))
+
+    if not results:
+        return pd.DataFrame(columns=[set_col, label_col, "reps"])
+    return pd.concat(results, ignore_index=True)
+
+
+class StreamingRepCounter:
+    """Counts the repetitions of a live set one resampled sample at a time. The lowpass filter
+    is causal and a peak is counted once the signal falls prominence below it, after having
+    risen prominence above the valley before it (a peak detector with hysteresis).
+    """
+
+    def __init__(self, preset: RepPreset, sampling_frequency: float = 5.0, cols: list[str] = SENSOR_COLUMNS):
+        self.preset = preset
+        self.sos = butter_lowpass_sos(preset.order, float(preset.cutoff), float(sampling_frequency))
+        self.cols = list(cols)
+        if preset.column == "acc_r":
+            self.positions = [self.cols.index(column) for column in ACCELEROMETER_COLUMNS]
+        elif preset.column == "gyr_r":
+            self.positions = [self.cols.index(column) for column in GYROSCOPE_AXES]
+        else:
+            self.positions = [self.cols.index(preset.column)]
+        self.reset()
+
+    def reset(self) -> None:
+        """Starts a new set."""
+        self.zi = None
+        self.reps = 0
+        self.rising = True
+
+    def push(self, values) -> int:
+        """Adds a resampled sample (values of cols) and returns the repetitions counted so far."""
+        selected = np.asarray(values, dtype=np.float64)[self.positions]
+        x = np.sqrt(np.sum(selected ** 2)) if len(self.positions) > 1 else selected[0]
+        if self.zi is None:
+            # Start from the steady state of the first sample instead of zero
+            self.zi = sosfilt_zi(self.sos) * x
+            self.peak = self.valley = x
+        filtered, self.zi = sosfilt(self.sos, [x], zi=self.zi)
+        value = filtered[0]
+
+        prominence = self.preset.prominence
+        if self.rising:
+            if value < self.valley:
+                self.valley = self.peak = value
+            self.peak = max(self.peak, value)
+            if self.peak - self.valley >= prominence and self.peak - value >= prominence:
+                self.reps += 1
+                self.rising = False
+                self.valley = value
+        else:
+            self.valley = min(self.valley, value)
+            if value - self.valley >= prominence:
+                self.rising = True
+                self.peak = value
+        return self.reps
+
+    def finish(self) -> int:
+        """Ends the set. The causal filter lags the movement, so the last repetition may not
+        have fallen enough yet, it is counted when it rose enough above its valley.
+        """
+        if self.rising and self.zi is not None and self.peak - self.valley >= self.preset.prominence:
+            self.reps += 1
+            self.rising = False
+        return self.reps
@@ -0,0 +1,242 @@
+import os
+import shutil
+from abc import ABC, abstractmethod
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from .data_common_functions import COLUMN_DTYPES, check_id_type, read_sql_table, read_distinct_values, full_load, incremental_insert, delete_rows
+from .database_functions import DatabaseConfig
+from .instrumentation_functions import instrument
+
+DEFAULT_PARQUET_DIR = str(Path(__file__).parent.parent.parent.joinpath("parquet_data"))
+
+
+class StorageBackend(ABC):
+    """Where the stages persist their tables (stg -> merged -> outliers -> clean).
+
+    read_table accepts the same filters as read_sql_table_chunks: columns, participants,
+    labels, start and end. The tables are indexed by epoch_ms. Every method is abstract, so a
+    backend that misses one can not be created.
+    """
+
+    @property
+    @abstractmethod
+    def identity(self) -> str:
+        """Which tables the backend holds (kind and location), e.g. to cache per backend."""
+
+    @abstractmethod
+    def read_table(self, table_schema: str, table_name: str, **filters) -> pd.DataFrame:
+        ...
+
+    @abstractmethod
+    def full_load(self, df: pd.DataFrame, table_schema: str, table_name: str) -> None:
+        ...
+
+    @abstractmethod
+    def incremental_insert(self, df: pd.DataFrame, table_schema: str, table_name: str) -> tuple[int, int]:
+        ...
+
+    @abstractmethod
+    def distinct_values(self, table_schema: str, table_name: str, column: str) -> set:
+        """Distinct values of a column, an empty set when the table does not exist."""
+
+    @abstractmethod
+    def delete_rows(self, table_schema: str, table_name: str, column: str, values: list) -> int:
+        """Deletes the rows whose column is one of the values and returns how many were deleted."""
+
+
+class PostgresBackend(StorageBackend):
+    """The tables live in PostgreSQL (or any database supported by the data movement functions)."""
+
+    def __init__(self, config: DatabaseConfig | None = None):
+        self.config = config or DatabaseConfig.from_env()
+
+    @property
+    def identity(self) -> str:
+        return f"postgres:{self.config.url.render_as_string(hide_password=True)}"
+
+    def read_table(self, table_schema: str, table_name: str, **filters) -> pd.DataFrame:
+        return read_sql_table(table_schema, table_name, config=self.config, **filters)
+
+    def full_load(self, df: pd.DataFrame, table_schema: str, table_name: str) -> None:
+        full_load(df, table_schema, table_name, config=self.config)
+
+    def incremental_insert(self, df: pd.DataFrame, table_schema: str, table_name: str) -> tuple[int, int]:
+        return incremental_insert(df, table_schema, table_name, config=self.config)
+
+    def distinct_values(self, table_schema: str, table_name: str, column: str) -> set:
+        return read_distinct_values(table_schema, table_name, column, config=self.config)
+
+    def delete_rows(self, table_schema: str, table_name: str, column: str, values: list) -> int:
+        return delete_rows(table_schema, table_name, column, values, config=self.config)
+
+
+class ParquetBackend(StorageBackend):
+    """Every table is a Parquet dataset in <root_dir>/<schema>/<table>, partitioned by
+    participant and label. Only the requested columns are read, and the filters skip
+    whole partitions (participant, label) or row groups (epoch_ms).
+    """
+
+    def __init__(self, root_dir: str = DEFAULT_PARQUET_DIR, partition_cols: tuple[str, ...] = ("participant", "label")):
+        self.root_dir = root_dir
+        self.partition_cols = partition_cols
+
+    @property
+    def identity(self) -> str:
+        return f"parquet:{os.path.abspath(self.root_dir)}"
+
+    def _path(self, table_schema: str, table_name: str) -> str:
+        return os.path.join(self.root_dir, table_schema, table_name)
+
+    @instrument()
+    def read_table(self, table_schema: str,
+                   table_name: str,
+                   columns: list[str] | None = None,
+                   participants: list[str] | None = None,
+                   labels: list[str] | None = None,
+                   start: pd.Timestamp | None = None,
+                   end: pd.Timestamp | None = None) -> pd.DataFrame:
+        filters = []
+        if participants is not None:
+            filters.append(("participant", "in", list(participants)))
+        if labels is not None:
+            filters.append(("label", "in", list(labels)))
+        if start is not None:
+            filters.append(("epoch_ms", ">=", pd.Timestamp(start)))
+        if end is not None:
+            filters.append(("epoch_ms", "<", pd.Timestamp(end)))
+        df = pd.read_parquet(
+            self._path(table_schema, table_name),
+            columns=["epoch_ms"] + list(columns) if columns is not None else None,
+            filters=filters or None
+        )
+        df = df.set_index("epoch_ms").sort_index()
+        dtypes = {column: dtype for column, dtype in COLUMN_DTYPES.items() if column in df.columns}
+        return df.astype(dtypes)
+
+    def _write(self, df: pd.DataFrame, path: str) -> None:
+        df.reset_index().to_parquet(
+            path,
+            partition_cols=[column for column in self.partition_cols if column in df.columns],
+            index=False
+        )
+
+    @instrument()
+    def full_load(self, df: pd.DataFrame, table_schema: str, table_name: str) -> None:
+        path = self._path(table_schema, table_name)
+        shutil.rmtree(path, ignore_errors=True)
+        self._write(df, path)
+
+    @instrument()
+    def incremental_insert(self, df: pd.DataFrame, table_schema: str, table_name: str) -> tuple[int, int]:
+        path = self._path(table_schema, table_name)
+        batch_size = len(df.index)
+        if os.path.exists(path):
+            existing_ids = pd.read_parquet(path, columns=["id"])["id"]
+            check_id_type(df, pd.api.types.is_integer_dtype(existing_ids), table_schema, table_name)
+            df = df[~df["id"].isin(existing_ids)]
+        df = df.drop_duplicates(subset="id")
+        # New files are added next to the existing ones in every partition
+        if not df.empty:
+            self._write(df, path)
+        return len(df.index), batch_size - len(df.index)
+
+    def distinct_values(self, table_schema: str, table_name: str, column: str) -> set:
+        path = self._path(table_schema, table_name)
+        if not os.path.exists(path):
+            return set()
+        return set(pd.read_parquet(path, columns=[column])[column].unique())
+
+    @instrument()
+    def delete_rows(self, table_schema: str, table_name: str, column: str, values: list) -> int:
+        path = self._path(table_schema, table_name)
+        if not values or not os.path.exists(path):
+            return 0
+        # Parquet files can not be edited, the rows that are kept are written again
+        df = self.read_table(table_schema, table_name)
+        deleted = df[column].isin(list(values))
+        if deleted.any():
+            self.full_load(df[~deleted], table_schema, table_name)
+        return int(deleted.sum())
+
+
+class MemoryBackend(StorageBackend):
+    """Every table is a dataframe kept in this process, e.g. to run or benchmark the stages
+    without a database. It only lives as long as the backend object.
+    """
+
+    def __init__(self):
+        self.tables: dict[tuple[str, str], pd.DataFrame] = {}
+
+    @property
+    def identity(self) -> str:
+        # Only this object holds the tables
+        return f"memory:{id(self)}"
+
+    @instrument()
+    def read_table(self, table_schema: str,
+                   table_name: str,
+                   columns: list[str] | None = None,
+                   participants: list[str] | None = None,
+                   labels: list[str] | None = None,
+                   start: pd.Timestamp | None = None,
+                   end: pd.Timestamp | None = None) -> pd.DataFrame:
+        df = self.tables[(table_schema, table_name)]
+        mask = np.ones(len(df.index), dtype=bool)
+        if participants is not None:
+            mask &= df["participant"].isin(list(participants)).to_numpy()
+        if labels is not None:
+            mask &= df["label"].isin(list(labels)).to_numpy()
+        if start is not None:
+            mask &= df.index >= pd.Timestamp(start)
+        if end is not None:
+            mask &= df.index < pd.Timestamp(end)
+        df = df.loc[mask, list(columns) if columns is not None else df.columns]
+        df = df.rename_axis("epoch_ms").sort_index()
+        dtypes = {column: dtype for column, dtype in COLUMN_DTYPES.items() if column in df.columns}
+        return df.astype(dtypes)
+
+    @instrument()
+    def full_load(self, df: pd.DataFrame, table_schema: str, table_name: str) -> None:
+        self.tables[(table_schema, table_name)] = df.copy()
+
+    @instrument()
+    def incremental_insert(self, df: pd.DataFrame, table_schema: str, table_name: str) -> tuple[int, int]:
+        existing = self.tables.get((table_schema, table_name))
+        new_rows = df.drop_duplicates(subset="id")
+        if existing is not None:
+            check_id_type(df, pd.api.types.is_integer_dtype(existing["id"]), table_schema, table_name)
+            new_rows = new_rows[~new_rows["id"].isin(existing["id"])]
+            self.tables[(table_schema, table_name)] = pd.concat([existing, new_rows])
+        else:
+            self.tables[(table_schema, table_name)] = new_rows.copy()
+        return len(new_rows.index), len(df.index) - len(new_rows.index)
+
+    def distinct_values(self, table_schema: str, table_name: str, column: str) -> set:
+        if (table_schema, table_name) not in self.tables:
+            return set()
+        return set(self.tables[(table_schema, table_name)][column].unique())
+
+    @instrument()
+    def delete_rows(self, table_schema: str, table_name: str, column: str, values: list) -> int:
+        df = self.tables.get((table_schema, table_name))
+        if df is None or not values:
+            return 0
+        deleted = df[column].isin(list(values))
+        self.tables[(table_schema, table_name)] = df[~deleted]
+        return int(deleted.sum())
+
+
+def get_storage_backend(name: str | None = None) -> StorageBackend:
+    """Returns the backend selected by name or by the FITNESS_TRACKER_STORAGE environment
+    variable: 'postgres' (default), 'parquet' (stored in FITNESS_TRACKER_PARQUET_DIR) or
+    'memory' (not persisted).
+    """
+    name = name or os.environ.get("FITNESS_TRACKER_STORAGE", "postgres")
+    if name == "postgres":
+        return PostgresBackend()
+    if name == "parquet":
+        return ParquetBackend(os.environ.get("FITNESS_TRACKER_PARQUET_DIR", DEFAULT_PARQUET_DIR))
+    if name == "memory":
+        return MemoryBackend()
+    raise ValueError(f"Error: Invalid storage backend '{name}'. Correct values are 'postgres', 'parquet' or 'memory'.")
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+from scipy.signal import sosfilt
+from .data_common_functions import ACCELEROMETER_COLUMNS, SENSOR_COLUMNS
+from .feature_engineering_functions import butter_lowpass_sos, FourierTransformation
+
+GYROSCOPE_AXES = [column for column in SENSOR_COLUMNS if column not in ACCELEROMETER_COLUMNS]
+
+
+class StreamingResampler:
+    """Online version of merge_sensor_data for a live recording. The samples of every sensor
+    are averaged in bins of time_rule, and a bin is emitted once both sensors have moved past
+    it. Bins that only one sensor has data for are dropped, like the inner join of the batch path.
+    """
+
+    def __init__(self, time_rule: str = "200ms"):
+        self.bin_ms = pd.Timedelta(time_rule) // pd.Timedelta("1ms")
+        self.columns = {"Accelerometer": ACCELEROMETER_COLUMNS, "Gyroscope": GYROSCOPE_AXES}
+        # Open bins: bin -> sensor -> [sum of the samples, compensation, number of samples].
+        # The stored sensor values are float32, they are summed in float32 with Kahan
+        # compensation like the pandas groupby mean, so the bins are bit-identical.
+        self.bins: dict[int, dict[str, list]] = {}
+        self.last_bin = dict.fromkeys(self.columns)
+
+    def push(self, sensor: str, epoch_ms: int, values) -> list[tuple[int, np.ndarray]]:
+        """Adds a sample of a sensor ('Accelerometer' or 'Gyroscope') with its three axes.
+
+        Returns:
+            list: (bin start in epoch ms, averaged SENSOR_COLUMNS) of every bin that was completed
+        """
+        bin_ms = epoch_ms - epoch_ms % self.bin_ms
+        totals = self.bins.setdefault(bin_ms, {}).setdefault(
+            sensor, [np.zeros(3, dtype=np.float32), np.zeros(3, dtype=np.float32), 0]
+        )
+        y = np.asarray(values, dtype=np.float32) - totals[1]
+        t = totals[0] + y
+        totals[1] = (t - totals[0]) - y
+        totals[0] = t
+        totals[2] += 1
+        self.last_bin[sensor] = bin_ms
+        if any(last_bin is None for last_bin in self.last_bin.values()):
+            return []
+        return self._emit(min(self.last_bin.values()))
+
+    def flush(self) -> list[tuple[int, np.ndarray]]:
+        """Emits the bins that are still open, at the end of the recording."""
+        return self._emit(None)
+
+    def _emit(self, before: int | None) -> list[tuple[int, np.ndarray]]:
+        rows = []
+        for bin_ms in sorted(self.bins):
+            if before is not None and bin_ms >= before:
+                break
+            totals = self.bins.pop(bin_ms)
+            if len(totals) == len(self.columns):
+                means = [totals[sensor][0] / np.float32(totals[sensor][2]) for sensor in self.columns]
+                rows.append((bin_ms, np.concatenate(means).astype(np.float64)))
+        return rows
+
+
+class StreamingFeatureExtractor:
+    """Computes the features of extract_set_features one resampled sample at a time, for a
+    live set. The lowpass filter is causal (its state is kept between samples), so the
+    features are the ones of the batch path with phase_shift=False. The work per sample
+    only depends on the window sizes: ring buffers hold the last fft_window_size + 1 samples.
+    """
+
+    def __init__(self,
+                 cols: list[str] = SENSOR_COLUMNS,
+                 sampling_frequency: float = 5.0,
+                 cutoff_frequency: float = 1.3,
+                 rolling_window_size: int = 5,
+                 fft_window_size: int = 14,
+                 order: int = 5):
+        self.cols = list(cols)
+        self.rolling_window_size = rolling_window_size
+        self.fft_window_size = fft_window_size
+        self.sos = butter_lowpass_sos(order, float(cutoff_frequency), float(sampling_frequency))
+        self.freqabs = FourierTransformation()
+        self.freqs = np.round(np.fft.rfftfreq(int(fft_window_size)) * int(sampling_frequency), 3)
+        self.acc_positions = [self.cols.index(column) for column in ACCELEROMETER_COLUMNS]
+        self.gyr_positions = [self.cols.index(column) for column in GYROSCOPE_AXES]
+
+        feature_columns = self.cols + ["acc_r", "gyr_r"]
+        self.feature_names = feature_columns + [
+            f"{col}_temp_{aggregation}_ws_{rolling_window_size}"
+            for col in feature_columns for aggregation in ("mean", "std")
+        ]
+        for col in feature_columns:
+            self.feature_names += [f"{col}_max_freq", f"{col}_freq_weighted", f"{col}_pse"] + [
+                f"{col}_freq_{freq}_Hz_ws_{fft_window_size}" for freq in self.freqs
+            ]
+        self.reset(len(feature_columns))
+
+    def reset(self, n_columns: int | None = None) -> None:
+        """Starts a new set: clears the filter state and the windows."""
+        n_columns = n_columns or self.buffer.shape[1]
+        # Filter state of every second-order section, zero like sosfilt without zi
+        self.zi = np.zeros((self.sos.shape[0], 2, len(self.cols)))
+        self.buffer = np.zeros((self.fft_window_size + 1, n_columns))
+        self.count = 0
+
+    def _window(self, size: int) -> np.ndarray:
+        # Last size samples of the ring buffer, oldest first
+        positions = (self.count - size + np.arange(size)) % len(self.buffer)
+        return self.buffer[positions]
+
+    def push(self, values) -> np.ndarray:
+        """Adds a resampled sample (values of cols) and returns its features, in the order of
+        feature_names. Features without enough history are NaN.
+        """
+        filtered, self.zi = sosfilt(self.sos, np.asarray(values, dtype=np.float64)[np.newaxis], axis=0, zi=self.zi)
+        filtered = filtered[0]
+        sample = np.concatenate([
+            filtered,
+            [np.sqrt(np.sum(filtered[self.acc_positions] ** 2)), np.sqrt(np.sum(filtered[self.gyr_positions] ** 2))]
+        ])
+        self.buffer[self.count % len(self.buffer)] = sample
+        self.count += 1
+        n_columns = len(sample)
+
+        rolling = np.full((n_columns, 2), np.nan)
+        if self.count >= self.rolling_window_size:
+            window = self._window(self.rolling_window_size)
+            rolling[:, 0] = window.mean(axis=0)
+            rolling[:, 1] = window.std(axis=0)
+
+        frequency = np.full((n_columns, 3 + len(self.freqs)), np.nan)
+        if self.count > self.fft_window_size:
+            real_ampl = np.fft.rfft(self._window(self.fft_window_size + 1).T, axis=-1).real
+            max_freq, freq_weighted, pse = self.freqabs.spectral_features(real_ampl, self.freqs)
+            frequency = np.column_stack([max_freq, freq_weighted, pse, real_ampl])
+
+        return np.concatenate([sample, rolling.ravel(), frequency.ravel()])
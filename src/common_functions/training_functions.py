@@ -0,0 +1,185 @@
+import json
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import GridSearchCV, GroupKFold, cross_val_score
+from sklearn.naive_bayes import GaussianNB
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.neural_network import MLPClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+from .storage_functions import StorageBackend
+
+DEFAULT_FEATURE_CACHE_DIR = str(Path(__file__).parent.parent.parent.joinpath("feature_cache"))
+
+# Columns of clean.fitness_tracker that are not features: the target, the groups of the
+# splits and the metadata (the duration comes from the category, not from the movement)
+NON_FEATURE_COLUMNS = ["participant", "label", "category", "set", "id", "duration"]
+
+# Classifiers of the model search and their grids
+CLASSIFIERS = {
+    "random_forest": (
+        RandomForestClassifier(random_state=0),
+        {"n_estimators": [50, 100], "min_samples_leaf": [2, 10], "criterion": ["gini", "entropy"]}
+    ),
+    "decision_tree": (
+        DecisionTreeClassifier(random_state=0),
+        {"min_samples_leaf": [2, 10, 50], "criterion": ["gini", "entropy"]}
+    ),
+    "k_nearest_neighbors": (
+        make_pipeline(StandardScaler(), KNeighborsClassifier()),
+        {"kneighborsclassifier__n_neighbors": [1, 5, 10]}
+    ),
+    "naive_bayes": (GaussianNB(), {}),
+    "neural_network": (
+        make_pipeline(StandardScaler(), MLPClassifier(max_iter=1000, random_state=0)),
+        {"mlpclassifier__hidden_layer_sizes": [(5,), (10,), (25,)], "mlpclassifier__alpha": [1e-4, 1e-2]}
+    )
+}
+
+
+class FeatureMatrix:
+    """The features of clean.fitness_tracker as a float32 matrix memory-mapped from
+    <cache_dir>/features.npy, plus the labels, participants and sets of its rows.
+    """
+
+    def __init__(self, X: np.ndarray, feature_names: list[str], labels: np.ndarray,
+                 participants: np.ndarray, sets: np.ndarray):
+        self.X = X
+        self.feature_names = feature_names
+        self.labels = labels
+        self.participants = participants
+        self.sets = sets
+
+
+def load_feature_matrix(storage: StorageBackend,
+                        cache_dir: str = DEFAULT_FEATURE_CACHE_DIR,
+                        cache_key: str | None = None,
+                        refresh: bool = False) -> FeatureMatrix:
+    """Returns the feature matrix of clean.fitness_tracker, reading the table only when there is
+    no cache, the cache was built for another cache_key (e.g. the version written by
+    build_features), there is no cache_key or refresh is set. Otherwise the matrix is
+    memory-mapped, so repeated experiments and the joblib workers share the same pages
+    instead of copies.
+
+    Args:
+        storage (StorageBackend): Where the tables are stored
+        cache_dir (str, optional): Directory of the cache. Defaults to DEFAULT_FEATURE_CACHE_DIR.
+        cache_key (str, optional): Version of the table the cache must have been built from. Defaults
+                                   to None, the version is unknown and the table is always read.
+        refresh (bool, optional): Read the table again. Defaults to False.
+
+    Returns:
+        FeatureMatrix: The float32 features (read-only memmap) and the metadata of the rows
+    """
+    matrix_path = os.path.join(cache_dir, "features.npy")
+    rows_path = os.path.join(cache_dir, "rows.parquet")
+    meta_path = os.path.join(cache_dir, "meta.json")
+
+    meta = None
+    if not refresh and cache_key is not None and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("cache_key") != cache_key:
+            meta = None
+
+    if meta is None:
+        df = storage.read_table(table_schema="clean", table_name="fitness_tracker")
+        feature_names = [column for column in df.columns if column not in NON_FEATURE_COLUMNS]
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(matrix_path, df[feature_names].to_numpy(dtype=np.float32))
+        df[["label", "participant", "set"]].reset_index(drop=True).to_parquet(rows_path)
+        meta = {"cache_key": cache_key, "feature_names": feature_names}
+        # Written last, an interrupted build is not mistaken for a valid cache
+        with open(meta_path, "w") as f:
+            json.dump(meta, f, indent=2)
+
+    rows = pd.read_parquet(rows_path)
+    return FeatureMatrix(
+        X=np.load(matrix_path, mmap_mode="r"),
+        feature_names=meta["feature_names"],
+        labels=rows["label"].astype(str).to_numpy(),
+        participants=rows["participant"].astype(str).to_numpy(),
+        sets=rows["set"].to_numpy()
+    )
+
+
+def get_participant_splits(groups: np.ndarray, n_splits: int = 5) -> GroupKFold:
+    """Folds that never have the same participant in train and test, so the scores are the
+    ones of a participant the model has not seen.
+    """
+    return GroupKFold(n_splits=min(n_splits, len(np.unique(groups))))
+
+
+def _score_features(estimator, X: np.ndarray, y: np.ndarray, groups: np.ndarray, columns: list[int], cv) -> float:
+    return cross_val_score(estimator, X[:, columns], y, groups=groups, cv=cv).mean()
+
+
+def forward_selection(features: FeatureMatrix,
+                      max_features: int = 10,
+                      estimator=None,
+                      n_jobs: int = -1) -> tuple[list[str], list[float]]:
+    """Greedy forward feature selection. At every step the feature that gives the best
+    participant-grouped accuracy together with the ones already selected is added, the
+    candidates of a step are evaluated in parallel.
+
+    Args:
+        features (FeatureMatrix): The features
+        max_features (int, optional): Number of features to select. Defaults to 10.
+        estimator (optional): Classifier used to score. Defaults to a decision tree.
+        n_jobs (int, optional): Parallel jobs, -1 uses all the CPUs. Defaults to -1.
+
+    Returns:
+        tuple: Selected feature names (in selection order) and the accuracy after every step
+    """
+    estimator = estimator or DecisionTreeClassifier(min_samples_leaf=10, random_state=0)
+    cv = get_participant_splits(features.participants)
+    selected, scores = [], []
+    remaining = list(range(len(features.feature_names)))
+    with Parallel(n_jobs=n_jobs) as parallel:
+        for _ in range(min(max_features, len(remaining))):
+            candidate_scores = parallel(
+                delayed(_score_features)(estimator, features.X, features.labels, features.participants, selected + [column], cv)
+                for column in remaining
+            )
+            best = int(np.argmax(candidate_scores))
+            selected.append(remaining.pop(best))
+            scores.append(float(candidate_scores[best]))
+    return [features.feature_names[column] for column in selected], scores
+
+
+def grid_search(features: FeatureMatrix,
+                feature_names: list[str] | None = None,
+                classifiers: dict | None = None,
+                n_jobs: int = -1) -> pd.DataFrame:
+    """Grid search of every classifier with participant-grouped cross validation.
+
+    Args:
+        features (FeatureMatrix): The features
+        feature_names (list, optional): Features to use. Defaults to all of them.
+        classifiers (dict, optional): Name -> (estimator, grid). Defaults to CLASSIFIERS.
+        n_jobs (int, optional): Parallel fits, -1 uses all the CPUs. Defaults to -1.
+
+    Returns:
+        pd.DataFrame: Best accuracy, its parameters and the fitted search of every classifier,
+        best first
+    """
+    classifiers = classifiers or CLASSIFIERS
+    columns = [features.feature_names.index(name) for name in feature_names or features.feature_names]
+    X = features.X[:, columns]
+    cv = get_participant_splits(features.participants)
+    results = []
+    for name, (estimator, grid) in classifiers.items():
+        search = GridSearchCV(estimator, grid, cv=cv, n_jobs=n_jobs)
+        search.fit(X, features.labels, groups=features.participants)
+        results.append({
+            "classifier": name,
+            "accuracy": search.best_score_,
+            "params": search.best_params_,
+            "search": search
+        })
+    return pd.DataFrame(results).sort_values("accuracy", ascending=False, ignore_index=True)
@@ -1,142 +1,136 @@
-from ..common_functions.feature_engineering_functions import FourierTransformation, LowPassFilter, PrincipalComponentAnalysis, NumericalAbstraction
-from ..common_functions.data_common_functions import read_sql_table, full_load
-import numpy as np
+from ..common_functions.feature_extraction_functions import extract_features_by_set
+from ..common_functions.data_common_functions import SENSOR_COLUMNS, apply_dtype_policy
+from ..common_functions.model_state_functions import DEFAULT_MODEL_DIR, FEATURE_PIPELINE_FILE, FeatureModelState, clear_features_version, save_features_version, get_set_fingerprints
+from ..common_functions.storage_functions import StorageBackend, get_storage_backend
+from ..common_functions.instrumentation_functions import instrument
+import os
 import pandas as pd
-from sklearn.cluster import KMeans
 
-if __name__ == '__main__':
-    # Load the data
-    df = read_sql_table(
+@instrument("stage.features")
+def run(storage: StorageBackend,
+        time_rule: str = "200ms",
+        cutoff: float = 1.3,
+        pca_components: int = 3,
+        rolling_window_size: int = 5,
+        fft_window_size: int = 14,
+        n_clusters: int = 5,
+        max_workers: int | None = None,
+        full_refresh: bool = False,
+        model_dir: str = DEFAULT_MODEL_DIR) -> None:
+    """Builds the features of the outliers table and loads them into clean.fitness_tracker.
+
+    Args:
+        storage (StorageBackend): Where the tables are stored
+        time_rule (str, optional): Rule used to resample the data. Defaults to "200ms".
+        cutoff (float, optional): Cutoff frequency of the lowpass filter. This value is obtained via
+                                  experimenting using visualization to see the results. Defaults to 1.3.
+        pca_components (int, optional): This was chosen using the elbow method using pc_values. Defaults to 3.
+        rolling_window_size (int, optional): Samples in the rolling windows (1000ms). Defaults to 5.
+        fft_window_size (int, optional): Samples in the frequency windows (2800ms). Defaults to 14.
+        n_clusters (int, optional): This is obtained using the inertias with the elbow method. Defaults to 5.
+        max_workers (int, optional): Processes extracting the features of the sets. Defaults to the number of CPUs.
+        full_refresh (bool, optional): Fit the PCA and the clusters from scratch instead of updating the
+                                       persisted ones. Needed after the outliers table was rebuilt with
+                                       another C (run_pipeline does it by itself). Defaults to False.
+        model_dir (str, optional): Where the fitted PCA and clusters and the version of the table are persisted.
+                                   Defaults to DEFAULT_MODEL_DIR.
+    """
+    predictor_columns = SENSOR_COLUMNS
+
+    # Load the data, only the columns that are needed
+    df = storage.read_table(
             table_schema="outliers",
             table_name="fitness_tracker_chauvenet",
-            username="postgres",
-            password="postgres",
-            hostname="localhost",
-            port=5432,
-            database="ml-fitness-tracker"
+            columns=predictor_columns + ["participant", "label", "category", "set", "id"]
     )
 
-    predictor_columns = list(df.columns[4:10])
-
     # Imputate NaN values after outlier detection
     for col in predictor_columns:
         df[col] = df[col].interpolate()
     
     # Calculate duration of the set for noise reduction
-    for set in df["set"].unique():
-        set_start = df[df["set"] == set].index[0]
-        set_end = df[df["set"] == set].index[-1]
-        set_duration = set_end - set_start
-        # Adding a column called duration
-        df.loc[(df["set"] == set), "duration"] = set_duration.seconds
+    epoch = df.index.to_series()
+    set_duration = epoch.groupby(df["set"]).transform("max") - epoch.groupby(df["set"]).transform("min")
+    # Adding a column called duration
+    df["duration"] = set_duration.dt.seconds.to_numpy()
 
     # Mean of the duration of the set by category
     df_duration_by_cat = df.groupby(["category"])["duration"].mean()
 
-
-    # Reducing the noise of each repetition. During training
-    # the adjustments of the hands, bars, etc. can come up in
-    # the data, so that needs to be filtered.
-    # Using Butterworth lowpass filter
-    df_lowpass = df.copy()
-    lowpass = LowPassFilter()
+    # Reducing the noise of each repetition (adjustments of the hands, bars, etc.) with a
+    # Butterworth lowpass filter, then the scalar magnitudes, the rolling averages and the
+    # frequency abstraction. Sets are independent, so they are processed in parallel.
     # In a previous step (resample frequency), the frequency used was
     # 200ms, so for 1000ms that is 5 entries
-    fs = 1000/200
-    cutoff = 1.3 # This value is obtained via experimenting using visualization to see the results
-    for col in predictor_columns:            
-        df_lowpass = lowpass.low_pass_filter(
-            data_table=df_lowpass,
-            col=col,
-            sampling_frequency=fs,
-            cutoff_frequency=cutoff
-        )
-        # Overwriting the original columns with the lowpass ones
-        df_lowpass[col] = df_lowpass[f"{col}_lowpass"]
-        del df_lowpass[f"{col}_lowpass"]
-    
-    # PCA to reduce the complexity of the data
-    df_pca = df_lowpass.copy()
-    pca = PrincipalComponentAnalysis()
-    # This is used to visualize the variance when selecting the
-    # number of variables/features for the PCA process. The method
-    # used was the elbow method.
-    pc_values = pca.determine_pc_explained_variance(
-        data_table=df_pca,
-        cols=predictor_columns
+    fs = pd.Timedelta("1s") / pd.Timedelta(time_rule)
+    df_features = extract_features_by_set(
+        df,
+        predictor_columns,
+        sampling_frequency=fs,
+        cutoff_frequency=cutoff,
+        rolling_window_size=rolling_window_size,
+        fft_window_size=fft_window_size,
+        max_workers=max_workers
     )
-    df_pca = pca.apply_pca(
-        data_table=df_pca,
+
+    # PCA to reduce the complexity of the data and clustering. The models are fitted once
+    # and persisted, later runs only update them with the sets they have not seen. They are
+    # fitted again when the rows of a set they have seen changed upstream (e.g. a recording
+    # that was loaded again). The sets are fingerprinted on the merged rows, the outliers of
+    # the sets that were seen move a little whenever new sets of their label are added.
+    state_path = os.path.join(model_dir, FEATURE_PIPELINE_FILE)
+    set_fingerprints = get_set_fingerprints(
+        storage.read_table(table_schema="merged", table_name="fitness_tracker", columns=["set", "id"])
+    )
+    state = FeatureModelState.load_or_create(
+        params={
+            "time_rule": time_rule,
+            "cutoff": cutoff,
+            "pca_components": pca_components,
+            "rolling_window_size": rolling_window_size,
+            "fft_window_size": fft_window_size,
+            "n_clusters": n_clusters
+        },
+        path=state_path,
+        refit=full_refresh,
+        set_fingerprints=set_fingerprints,
         cols=predictor_columns,
-        number_comp=3 # This was chosen using the elbow method using pc_values
+        n_components=pca_components,
+        cluster_cols=["x_axis_g", "y_axis_g", "z_axis_g"],
+        n_clusters=n_clusters
     )
+    new_sets = state.partial_fit(df_features, set_fingerprints=set_fingerprints)
+    print(f"Feature models updated with {new_sets} new sets ({len(state.seen_sets)} in total)")
+    # This is used to visualize the variance when selecting the
+    # number of variables/features for the PCA process. The method
+    # used was the elbow method.
+    pc_values = state.explained_variance_ratio_
+    df_pca = state.transform(df_features)
 
-    # To help the model generalize better, the three values (x, y and z) of the accelerometer
-    # and gyroscope will be converted into a single scalar value per each device
-    # to make it impartial to any device orientation and can handle dynamic re-orientations.
-    # The technique used will be sum of squares.
-    df_squared = df_pca.copy()
-    acc_r = df_squared["x_axis_g"] ** 2 + df_squared["y_axis_g"] ** 2 + df_squared["z_axis_g"] ** 2
-    gyr_r = df_squared["x_axis_deg_s"] ** 2 + df_squared["y_axis_deg_s"] ** 2 + df_squared["z_axis_deg_s"] ** 2
-    df_squared["acc_r"] = np.sqrt(acc_r)
-    df_squared["gyr_r"] = np.sqrt(gyr_r)
-
-    # Calculating the rolling average for the dataset to obtain more data from the dataset
-    # similar to window functions
-    df_rolling = df_squared.copy()
-    numabs = NumericalAbstraction()
-    window_size = int(1000/200)
-    predictor_columns = predictor_columns + ["acc_r", "gyr_r"]
-
-    # A subset of the data is needed to not mix different sets data
-    df_rolling_list = []
-    for set in df_rolling["set"].unique():
-        subset = df_rolling[df_rolling["set"] == set].copy()
-        for col in predictor_columns:
-            subset = numabs.abstract_numerical(subset, [col], window_size, "mean")
-            subset = numabs.abstract_numerical(subset, [col], window_size, "std")
-        df_rolling_list.append(subset)
-    df_rolling = pd.concat(df_rolling_list)
-
-    # Frequency abstraction. Usefull to obtain insights and components from
-    # frequency data
-    df_frequency = df_rolling.copy().reset_index()
-    freqabs = FourierTransformation()
-    frequency = int(1000/200)
-    window_size = int(2800/200)
-    df_frequency_list = []
-    for s in df_frequency["set"].unique():
-        subset = df_frequency[df_frequency["set"] == s].reset_index(drop=True).copy()
-        subset = freqabs.abstract_frequency(subset, predictor_columns, window_size, frequency)
-        df_frequency_list.append(subset)
-    df_frequency = pd.concat(df_frequency_list).set_index("epoch_ms", drop=True)
+    # The principal components go right after the columns of the original table
+    pca_columns = [f"pca_{i}" for i in range(1, pca_components + 1)]
+    base_columns = list(df.columns)
+    feature_columns = [col for col in df_pca.columns if col not in base_columns + pca_columns + ["cluster"]]
+    df_frequency = df_pca[base_columns + pca_columns + feature_columns + ["cluster"]]
 
     # Dealing with overlapping windows to avoid overfiting
     df_frequency = df_frequency.dropna()
     # To avoid overlaping, 50% of the data will be dropped by skipping every other row
-    df_frequency = df_frequency.iloc[::2]
+    df_cluster = apply_dtype_policy(df_frequency.iloc[::2])
 
-    # Clustering
-    df_cluster = df_frequency.copy()
-    cluster_columns = ["x_axis_g", "y_axis_g", "z_axis_g"]
-    k = 5 # This is obtained using the inertias with the elbow method
-    kmeans = KMeans(n_clusters=k, n_init=20, random_state=0)
-    subset = df_cluster[cluster_columns]
-    df_cluster["cluster"] = kmeans.fit_predict(subset)
+    # The fitted models are needed to build the same features at inference time
+    state.save(state_path)
 
-    # Insert into table
-    full_load(
+    # Insert into table. Its version is what the cached feature matrix of train_model is
+    # checked against, so it is forgotten until the new table is written.
+    clear_features_version(model_dir)
+    storage.full_load(
         df=df_cluster,
         table_schema="clean",
-        table_name="fitness_tracker",
-        username="postgres",
-        password="postgres",
-        hostname="localhost",
-        port=5432,
-        database="ml-fitness-tracker"
+        table_name="fitness_tracker"
     )
+    save_features_version(storage, df_cluster, model_dir)
 
 
-
-
-
+if __name__ == '__main__':
+    run(get_storage_backend())
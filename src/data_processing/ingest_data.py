@@ -1,36 +1,85 @@
-from ..common_functions.data_common_functions import get_files_directory, get_all_files_in_directory, read_data_into_dataframe, extract_features_from_filename_column, get_datetime_from_epoch, full_load
+import os
+from ..common_functions.data_common_functions import get_files_directory, get_all_files_in_directory, read_sensor_files, extract_features_from_filename_column, get_datetime_from_epoch, apply_dtype_policy
+from ..common_functions.manifest_functions import DEFAULT_MANIFEST_PATH, FileManifest, is_sensor_file
+from ..common_functions.storage_functions import StorageBackend, get_storage_backend
+from ..common_functions.instrumentation_functions import instrument
 
-if __name__ == '__main__':
-    data_dir_path = get_files_directory() # I will need to change this when working in S3
+STG_TABLES = ["fitness_tracker_accelerometer", "fitness_tracker_gyroscope"]
+
+@instrument("stage.ingest")
+def run(storage: StorageBackend,
+        data_dir_path: str | None = None,
+        manifest_path: str = DEFAULT_MANIFEST_PATH,
+        full_refresh: bool = False) -> bool:
+    """Loads the recordings in fitness_data that are not in the stg tables yet (or whose content
+    changed since they were loaded) into the stg tables.
+
+    Args:
+        storage (StorageBackend): Where the tables are stored
+        data_dir_path (str, optional): Glob of the recordings. Defaults to the files in fitness_data.
+        manifest_path (str, optional): SQLite file with the recordings that were loaded before.
+                                       Defaults to DEFAULT_MANIFEST_PATH.
+        full_refresh (bool, optional): Load every recording again, replacing the stg tables, instead
+                                       of only the new ones. Defaults to False.
+
+    Returns:
+        bool: Whether rows that were in the stg tables were replaced (a full load or changed
+        recordings), the tables built from them have to be rebuilt too
+    """
+    data_dir_path = data_dir_path or get_files_directory() # I will need to change this when working in S3
     files_list = get_all_files_in_directory(dir_path=data_dir_path) # And this
-    df_acc = read_data_into_dataframe(files_list=files_list, file_type="Accelerometer")
-    df_gyr = read_data_into_dataframe(files_list=files_list, file_type="Gyroscope")
+    sensor_files = [file_path for file_path in files_list if is_sensor_file(file_path)]
+    if len(sensor_files) < len(files_list):
+        print(f"Skipping {len(files_list) - len(sensor_files)} files that are not accelerometer or gyroscope recordings")
+    # Only the recordings that were not loaded before are processed. The manifest is only
+    # trusted for the files the stg tables actually hold (the tables can be emptied or be
+    # in another backend than the one the manifest was written for). A full refresh ignores both.
+    manifest = FileManifest(manifest_path)
+    loaded_filenames = set() if full_refresh else {
+        str(filename) for table_name in STG_TABLES
+        for filename in storage.distinct_values(table_schema="stg", table_name=table_name, column="filename")
+    }
+    new_files = manifest.get_new_files(files_list=sensor_files, loaded_filenames=loaded_filenames)
+    if not new_files:
+        print("No new recordings to ingest")
+        return False
+    set_numbers = manifest.assign_set_numbers(files_list=new_files)
+    df_acc, df_gyr, df_timings = read_sensor_files(files_list=new_files, set_numbers=set_numbers)
+    # Slowest files
+    print(df_timings.head(10).to_string(index=False))
     df_acc_with_features = extract_features_from_filename_column(df=df_acc)
     df_gyr_with_features = extract_features_from_filename_column(df=df_gyr)
-    df_acc_final = get_datetime_from_epoch(df=df_acc_with_features)
-    df_gyr_final = get_datetime_from_epoch(df=df_gyr_with_features)
+    # Categorical metadata and float32 sensors from here on, the later stages keep these types
+    df_acc_final = apply_dtype_policy(get_datetime_from_epoch(df=df_acc_with_features))
+    df_gyr_final = apply_dtype_policy(get_datetime_from_epoch(df=df_gyr_with_features))
+    # The first run (or a full refresh) replaces whatever is in the stg tables, afterwards the
+    # new recordings are appended
+    load = storage.full_load if not loaded_filenames else storage.incremental_insert
+    # The rows of the recordings whose content changed are deleted before the new ones are inserted,
+    # otherwise the table would have both versions
+    changed_filenames = sorted({os.path.basename(file_path) for file_path in new_files} & loaded_filenames)
+    if changed_filenames:
+        print(f"Replacing {len(changed_filenames)} changed recordings")
+        for table_name in STG_TABLES:
+            storage.delete_rows(table_schema="stg", table_name=table_name, column="filename", values=changed_filenames)
     # Insert accelerometer to stg table
-    full_load(
+    load(
         df=df_acc_final,
         table_schema="stg",
-        table_name="fitness_tracker_accelerometer",
-        username="postgres",
-        password="postgres",
-        hostname="localhost",
-        port=5432,
-        database="ml-fitness-tracker"
+        table_name=STG_TABLES[0]
     )
     # Insert gyroscope to stg table
-    full_load(
+    load(
         df=df_gyr_final,
         table_schema="stg",
-        table_name="fitness_tracker_gyroscope",
-        username="postgres",
-        password="postgres",
-        hostname="localhost",
-        port=5432,
-        database="ml-fitness-tracker"
+        table_name=STG_TABLES[1]
+    )
+    rows_by_filename = dict(zip(df_timings["filename"], df_timings["rows"]))
+    manifest.mark_loaded(
+        row_counts={file_path: rows_by_filename[os.path.basename(file_path)] for file_path in new_files}
     )
-    
+    return not loaded_filenames or bool(changed_filenames)
 
 
+if __name__ == '__main__':
+    run(get_storage_backend())
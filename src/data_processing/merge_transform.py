@@ -1,38 +1,49 @@
-import pandas as pd
-from ..common_functions.data_common_functions import read_sql_table, incremental_insert, resample_frequency
+from ..common_functions.data_common_functions import merge_sensor_data
+from ..common_functions.storage_functions import StorageBackend, get_storage_backend
+from ..common_functions.instrumentation_functions import instrument
 
-if __name__ == '__main__':
+@instrument("stage.merge")
+def run(storage: StorageBackend, time_rule: str = "200ms", full_refresh: bool = False) -> None:
+    """Merges and resamples the stg tables of both sensors and loads the result into merged.fitness_tracker.
+
+    Args:
+        storage (StorageBackend): Where the tables are stored
+        time_rule (str, optional): Rule used to resample the data. Defaults to "200ms".
+        full_refresh (bool, optional): Replace the table instead of inserting the new rows. Needed
+                                       when time_rule changes, otherwise the rows of both runs are kept. It
+                                       is also how tables with IDs of another scheme (see get_id_scheme,
+                                       e.g. the md5 IDs written before the float32 sensors) are upgraded:
+                                       run once with full_refresh=True (run_pipeline does it by itself).
+                                       Defaults to False.
+    """
     # Read accelerometer data
-    df_acc = read_sql_table(
+    df_acc = storage.read_table(
         table_schema="stg",
-        table_name="fitness_tracker_accelerometer",
-        username="postgres",
-        password="postgres",
-        hostname="localhost",
-        port=5432,
-        database="ml-fitness-tracker"
+        table_name="fitness_tracker_accelerometer"
     )
     # Read gyroscope data
-    df_gyr = read_sql_table(
+    df_gyr = storage.read_table(
         table_schema="stg",
-        table_name="fitness_tracker_gyroscope",
-        username="postgres",
-        password="postgres",
-        hostname="localhost",
-        port=5432,
-        database="ml-fitness-tracker"
+        table_name="fitness_tracker_gyroscope"
     )
-    df_merged = pd.concat([df_acc.iloc[:,4:7], df_gyr.iloc[:,1:8]], axis=1)
-    df_resampled = resample_frequency(df=df_merged)
+    # Both sensors are resampled to the same bins and joined
+    df_resampled = merge_sensor_data(df_acc=df_acc, df_gyr=df_gyr, time_rule=time_rule)
     df_resampled["set"] = df_resampled['set'].astype("int")
     # Insert data into table
-    incremental_insert(
+    if full_refresh:
+        storage.full_load(
+            df=df_resampled,
+            table_schema="merged",
+            table_name="fitness_tracker"
+        )
+        return
+    inserted, skipped = storage.incremental_insert(
         df=df_resampled,
         table_schema="merged",
-        table_name="fitness_tracker",
-        username="postgres",
-        password="postgres",
-        hostname="localhost",
-        port=5432,
-        database="ml-fitness-tracker"
-    )
\ No newline at end of file
+        table_name="fitness_tracker"
+    )
+    print(f"merged.fitness_tracker: inserted {inserted} rows, skipped {skipped} existing rows")
+
+
+if __name__ == '__main__':
+    run(get_storage_backend())
@@ -0,0 +1,163 @@
+import argparse
+import json
+import os
+import time
+from dataclasses import dataclass, fields
+from hashlib import md5
+from inspect import getsourcefile
+from pathlib import Path
+from . import ingest_data, merge_transform, remove_outliers, build_features
+from ..common_functions.data_common_functions import get_files_directory, get_all_files_in_directory
+from ..common_functions.hashing_functions import get_id_scheme
+from ..common_functions.storage_functions import StorageBackend, get_storage_backend
+
+DEFAULT_CACHE_PATH = str(Path(__file__).parent.parent.parent.joinpath(".pipeline_cache.json"))
+
+
+@dataclass(frozen=True)
+class PipelineParams:
+    """Tunable parameters of the stages."""
+    time_rule: str = "200ms"
+    chauvenet_c: int = 2
+    cutoff: float = 1.3
+    pca_components: int = 3
+    rolling_window_size: int = 5
+    fft_window_size: int = 14
+    n_clusters: int = 5
+
+
+@dataclass(frozen=True)
+class Stage:
+    """A node of the pipeline: the stages it runs after, the parameters its output depends on
+    (argument of its run function -> field of PipelineParams) and whether it keeps state between
+    runs (appends to its table or updates fitted models), in which case it has to be told to
+    rebuild it when the parameters or an upstream table change. Its run function can return
+    True when it replaced rows that were already in its table.
+    """
+    name: str
+    module: object
+    upstream: tuple[str, ...]
+    params: dict[str, str]
+    incremental: bool = False
+
+    def run(self, storage: StorageBackend, params: PipelineParams, full_refresh: bool) -> bool:
+        """Runs the stage and returns whether its table was rebuilt or had rows replaced."""
+        kwargs = {argument: getattr(params, field) for argument, field in self.params.items()}
+        if self.incremental:
+            kwargs["full_refresh"] = full_refresh
+        return bool(self.module.run(storage, **kwargs)) or full_refresh or not self.incremental
+
+
+# In execution order, every stage only depends on stages that come before it
+STAGES = [
+    Stage("ingest", ingest_data, upstream=(), params={}, incremental=True),
+    Stage("merge", merge_transform, upstream=("ingest",), params={"time_rule": "time_rule"}, incremental=True),
+    Stage("outliers", remove_outliers, upstream=("merge",), params={"C": "chauvenet_c"}, incremental=True),
+    Stage("features", build_features, upstream=("outliers",), params={
+        "time_rule": "time_rule",
+        "cutoff": "cutoff",
+        "pca_components": "pca_components",
+        "rolling_window_size": "rolling_window_size",
+        "fft_window_size": "fft_window_size",
+        "n_clusters": "n_clusters"
+    }, incremental=True),
+]
+
+
+def _hash(value) -> str:
+    return md5(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+def get_input_fingerprint() -> str:
+    """Fingerprint of the raw recordings (name, size and modification time of every file)."""
+    files = sorted(get_all_files_in_directory(get_files_directory()))
+    return _hash([(os.path.basename(f), os.path.getsize(f), os.path.getmtime(f)) for f in files])
+
+
+def get_stage_fingerprints(params: PipelineParams) -> dict[str, dict[str, str]]:
+    """Fingerprint of every stage output. It changes when the inputs, the code of the stage,
+    its parameters or any upstream fingerprint change. The parameters fingerprint alone is
+    kept too, to know when the stage has to replace its table instead of appending to it.
+    It includes the scheme of the row IDs, the IDs of another scheme can not be deduplicated.
+    """
+    fingerprints = {}
+    input_fingerprint = get_input_fingerprint()
+    id_scheme = get_id_scheme()
+    for stage in STAGES:
+        stage_params = {field: getattr(params, field) for field in stage.params.values()}
+        with open(getsourcefile(stage.module), "rb") as f:
+            code_fingerprint = md5(f.read()).hexdigest()
+        fingerprints[stage.name] = {
+            "params": _hash({"params": stage_params, "id_scheme": id_scheme}),
+            "output": _hash({
+                "stage": stage.name,
+                "params": stage_params,
+                "code": code_fingerprint,
+                "upstream": [fingerprints[name]["output"] for name in stage.upstream],
+                "inputs": input_fingerprint if not stage.upstream else None
+            })
+        }
+    return fingerprints
+
+
+def run_pipeline(storage: StorageBackend,
+                 params: PipelineParams = PipelineParams(),
+                 cache_path: str = DEFAULT_CACHE_PATH,
+                 force: bool = False) -> list[str]:
+    """Runs the stages whose cached output is not valid anymore, in order. A stage replaces its
+    table instead of appending to it when its parameters changed or an upstream stage rebuilt
+    (or replaced rows of) its table, so rows of different runs are never mixed.
+
+    Args:
+        storage (StorageBackend): Where the tables are stored
+        params (PipelineParams, optional): Parameters of the stages. Defaults to PipelineParams().
+        cache_path (str, optional): JSON file with the fingerprints of the last successful runs,
+                                    per storage backend.
+        force (bool, optional): Run every stage from scratch. Defaults to False.
+
+    Returns:
+        list: Names of the stages that were run
+    """
+    caches = {}
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            caches = json.load(f)
+    # The fingerprints only describe the tables of the backend they were saved for
+    cache = caches.setdefault(storage.identity, {})
+    fingerprints = get_stage_fingerprints(params)
+
+    executed = []
+    refreshed = set()
+    for stage in STAGES:
+        fingerprint = fingerprints[stage.name]
+        cached = cache.get(stage.name, {})
+        if not force and cached.get("output") == fingerprint["output"]:
+            print(f"[{stage.name}] cached, skipping")
+            continue
+        # New parameters (or IDs) change every row, so the table has to be rebuilt instead of appended
+        # to, and so do the tables built from a table that was rebuilt
+        full_refresh = force or cached.get("params") != fingerprint["params"] or not refreshed.isdisjoint(stage.upstream)
+        start = time.perf_counter()
+        if stage.run(storage, params, full_refresh=full_refresh):
+            refreshed.add(stage.name)
+            # If a downstream stage fails, the next run still has to rebuild it
+            for downstream in STAGES:
+                if stage.name in downstream.upstream:
+                    cache.pop(downstream.name, None)
+        print(f"[{stage.name}] done in {time.perf_counter() - start:.2f}s")
+        executed.append(stage.name)
+        # Saved after every stage, so a failure does not invalidate the stages that finished
+        cache[stage.name] = fingerprint
+        with open(cache_path, "w") as f:
+            json.dump(caches, f, indent=2)
+    return executed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the stages of the pipeline that are out of date.")
+    parser.add_argument("--force", action="store_true", help="Run every stage from scratch even if its output is cached")
+    for field in fields(PipelineParams):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=type(field.default), default=field.default)
+    args = vars(parser.parse_args())
+    force = args.pop("force")
+    run_pipeline(get_storage_backend(), params=PipelineParams(**args), force=force)
@@ -1,18 +1,26 @@
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-from ..common_functions.outliers_functions import mark_outliers_chauvenet
-from ..common_functions.data_common_functions import read_sql_table, incremental_insert, create_id
+from ..common_functions.outliers_functions import remove_outliers_chauvenet
+from ..common_functions.hashing_functions import hash_rows
+from ..common_functions.storage_functions import StorageBackend, get_storage_backend
+from ..common_functions.instrumentation_functions import instrument
 
-if __name__ == '__main__':
-    df = read_sql_table(
+@instrument("stage.outliers")
+def run(storage: StorageBackend, C: int = 2, full_refresh: bool = False) -> None:
+    """Removes the outliers of the merged table with Chauvenet's criterion and loads the result
+    into outliers.fitness_tracker_chauvenet.
+
+    Args:
+        storage (StorageBackend): Where the tables are stored
+        C (int, optional): Degree of certainty of Chauvenet's criterion. Defaults to 2.
+        full_refresh (bool, optional): Replace the table instead of inserting the new rows. Needed
+                                       when C changes, otherwise the rows of both runs are kept. It
+                                       is also how tables with IDs of another scheme (see get_id_scheme,
+                                       e.g. the md5 IDs written before the float32 sensors) are upgraded:
+                                       run once with full_refresh=True (run_pipeline does it by itself).
+                                       Defaults to False.
+    """
+    df = storage.read_table(
         table_schema="merged",
-        table_name="fitness_tracker",
-        username="postgres",
-        password="postgres",
-        hostname="localhost",
-        port=5432,
-        database="ml-fitness-tracker"
+        table_name="fitness_tracker"
     )
     # Drop ID column
     del df["id"]
@@ -27,28 +35,40 @@ if __name__ == '__main__':
         'z_axis_deg_s'
     ]
 
-    # Removing outliers
-    df_outliers_removed = df.copy()
-    for col in outlier_columns:
-        for label in df["label"].unique():
-            ds = mark_outliers_chauvenet(df[df["label"] == label], columns=[col])
-            # Replace outliers values with NaN
-            ds.loc[ds[f"{col}_outlier"], col] = np.nan
-            # Update the values in the dataframe
-            df_outliers_removed.loc[(df_outliers_removed["label"] == label), col] = ds[col]
+    # Removing outliers by label, the outliers values are replaced with NaN
+    df_outliers_removed = remove_outliers_chauvenet(df, columns=outlier_columns, group_col="label", C=C)
 
     # Insert ID into dataframe for incremental load
-    df_outliers_removed["id"] = df_outliers_removed.apply(create_id, axis=1).astype("string")
+    df_outliers_removed["id"] = hash_rows(df_outliers_removed)
     
     # Insert into table
-    incremental_insert(
-        df=df_outliers_removed,
+    if full_refresh:
+        storage.full_load(
+            df=df_outliers_removed,
+            table_schema="outliers",
+            table_name="fitness_tracker_chauvenet"
+        )
+        return
+    # The criterion is computed per label over every set, so new sets can change rows of the
+    # sets that were already cleaned. Those rows get other IDs and replace the previous ones.
+    stale_ids = storage.distinct_values(
+        table_schema="outliers",
+        table_name="fitness_tracker_chauvenet",
+        column="id"
+    ) - set(df_outliers_removed["id"])
+    deleted = storage.delete_rows(
         table_schema="outliers",
         table_name="fitness_tracker_chauvenet",
-        username="postgres",
-        password="postgres",
-        hostname="localhost",
-        port=5432,
-        database="ml-fitness-tracker"
+        column="id",
+        values=list(stale_ids)
     )
+    inserted, skipped = storage.incremental_insert(
+        df=df_outliers_removed,
+        table_schema="outliers",
+        table_name="fitness_tracker_chauvenet"
+    )
+    print(f"outliers.fitness_tracker_chauvenet: inserted {inserted} rows, skipped {skipped} existing rows, deleted {deleted} stale rows")
 
+
+if __name__ == '__main__':
+    run(get_storage_backend())
@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import json
+from http import HTTPStatus
+from ..common_functions.inference_functions import DEFAULT_MODEL_DIR, InferenceModel, parse_window
+
+
+class MicroBatcher:
+    """Collects the concurrent requests into batches (up to max_batch_size, waiting at most
+    max_wait_ms for more after the first one) so the model transforms and predicts them
+    with a single call. The model runs in a thread, the event loop keeps accepting requests.
+    """
+
+    def __init__(self, model: InferenceModel, max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def predict(self, window) -> dict:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((window, future))
+        return await future
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                results = await loop.run_in_executor(None, self.model.predict, [window for window, _ in batch])
+            except Exception:
+                # A window the model fails on only fails its own request: the windows of the
+                # batch are predicted one by one to find it
+                results = [await self._predict_one(loop, window) for window, _ in batch]
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def _predict_one(self, loop: asyncio.AbstractEventLoop, window) -> dict | Exception:
+        try:
+            return (await loop.run_in_executor(None, self.model.predict, [window]))[0]
+        except Exception as error:
+            return error
+
+
+async def _respond(writer: asyncio.StreamWriter, status: HTTPStatus, body: dict) -> None:
+    payload = json.dumps(body).encode()
+    writer.write(
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload
+    )
+    await writer.drain()
+
+
+def make_handler(batcher: MicroBatcher):
+    """Minimal HTTP/1.1 (keep-alive) handler: POST /predict with a raw sensor window as JSON
+    (see parse_window) and GET /health.
+    """
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                method, path, _ = request_line.decode().split(" ", 2)
+
+                if method == "GET" and path == "/health":
+                    await _respond(writer, HTTPStatus.OK, {"status": "ok"})
+                elif method == "POST" and path == "/predict":
+                    try:
+                        window = parse_window(json.loads(body))
+                    except (ValueError, TypeError) as error:
+                        await _respond(writer, HTTPStatus.BAD_REQUEST, {"error": str(error)})
+                        continue
+                    try:
+                        prediction = await batcher.predict(window)
+                    except Exception as error:
+                        await _respond(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(error)})
+                        continue
+                    await _respond(writer, HTTPStatus.OK, prediction)
+                else:
+                    await _respond(writer, HTTPStatus.NOT_FOUND, {"error": f"Error: Invalid route {method} {path}."})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+async def serve(host: str = "127.0.0.1",
+                port: int = 8000,
+                model_dir: str = DEFAULT_MODEL_DIR,
+                max_batch_size: int = 64,
+                max_wait_ms: float = 5.0) -> None:
+    """Loads the model once and serves the predictions until cancelled."""
+    batcher = MicroBatcher(InferenceModel.load(model_dir), max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    batch_task = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(make_handler(batcher), host, port)
+    print(f"Serving predictions on http://{host}:{port}/predict")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the exercise and repetition predictions over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model-dir", default=DEFAULT_MODEL_DIR)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.model_dir, args.max_batch_size, args.max_wait_ms))
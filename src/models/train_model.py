@@ -0,0 +1,56 @@
+import argparse
+import time
+from ..common_functions.inference_functions import save_classifier
+from ..common_functions.model_state_functions import get_features_version
+from ..common_functions.storage_functions import StorageBackend, get_storage_backend
+from ..common_functions.training_functions import DEFAULT_FEATURE_CACHE_DIR, load_feature_matrix, forward_selection, grid_search
+
+
+def run(storage: StorageBackend,
+        max_features: int = 10,
+        n_jobs: int = -1,
+        cache_dir: str = DEFAULT_FEATURE_CACHE_DIR,
+        refresh: bool = False) -> None:
+    """Selects the features and searches the classifiers that predict the exercise (label).
+
+    Args:
+        storage (StorageBackend): Where the tables are stored
+        max_features (int, optional): Features selected by the forward selection. Defaults to 10.
+        n_jobs (int, optional): Parallel jobs, -1 uses all the CPUs. Defaults to -1.
+        cache_dir (str, optional): Cache of the feature matrix. Defaults to DEFAULT_FEATURE_CACHE_DIR.
+        refresh (bool, optional): Read clean.fitness_tracker again instead of the cache. Defaults to False.
+    """
+    start = time.perf_counter()
+    # The cache is rebuilt when build_features wrote another table since it was written
+    features = load_feature_matrix(storage, cache_dir=cache_dir, cache_key=get_features_version(storage), refresh=refresh)
+    print(f"Feature matrix {features.X.shape} loaded in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    selected_features, scores = forward_selection(features, max_features=max_features, n_jobs=n_jobs)
+    print(f"Forward selection done in {time.perf_counter() - start:.2f}s")
+    for feature, score in zip(selected_features, scores):
+        print(f"  {feature}: {score:.4f}")
+
+    feature_sets = {"all": features.feature_names, "selected": selected_features}
+    best = None
+    for name, feature_names in feature_sets.items():
+        start = time.perf_counter()
+        results = grid_search(features, feature_names=feature_names, n_jobs=n_jobs)
+        print(f"\nGrid search with {name} features ({len(feature_names)}) done in {time.perf_counter() - start:.2f}s")
+        print(results[["classifier", "accuracy", "params"]].to_string(index=False))
+        if best is None or results.loc[0, "accuracy"] > best[0]:
+            best = (results.loc[0, "accuracy"], feature_names, results.loc[0, "search"].best_estimator_)
+
+    # The best model, refitted on all the rows, is the one served by predict_model
+    accuracy, feature_names, classifier = best
+    path = save_classifier(classifier, feature_names)
+    print(f"\nSaved {type(classifier).__name__} ({accuracy:.4f}) with {len(feature_names)} features in {path}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train the exercise classifiers with participant-grouped cross validation.")
+    parser.add_argument("--max-features", type=int, default=10)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--refresh", action="store_true", help="Read clean.fitness_tracker again instead of the cached matrix")
+    args = parser.parse_args()
+    run(get_storage_backend(), max_features=args.max_features, n_jobs=args.n_jobs, refresh=args.refresh)
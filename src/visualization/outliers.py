@@ -1,18 +1,12 @@
-import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
-from ..common_functions.outliers_functions import mark_outliers_lof, mark_outliers_chauvenet, mark_outliers_iqr, plot_binary_outliers
-from ..common_functions.data_common_functions import read_sql_table
+from ..common_functions.outliers_functions import mark_outliers_lof, mark_outliers_chauvenet, mark_outliers_iqr, plot_binary_outliers, remove_outliers_chauvenet
+from ..common_functions.storage_functions import get_storage_backend
 
 if __name__ == '__main__':
-    df = read_sql_table(
+    storage = get_storage_backend()
+    df = storage.read_table(
         table_schema="merged",
-        table_name="fitness_tracker",
-        username="postgres",
-        password="postgres",
-        hostname="localhost",
-        port=5432,
-        database="ml-fitness-tracker"
+        table_name="fitness_tracker"
     )
     
     # Outliers columns - First 3 are acc data and the other 3 are gyro data
@@ -115,15 +109,9 @@ if __name__ == '__main__':
     
     # Now, a decision has to be made about what method is going to be used
     # and for now the decision is to use chauvenet because of the previous results
-    df_outliers_removed = df.copy()
-    for col in outlier_columns:
-        for label in df["label"].unique():
-            ds = mark_outliers_chauvenet(df[df["label"] == label], columns=[col])
-            # Replace outliers values with NaN
-            ds.loc[ds[f"{col}_outlier"], col] = np.nan
-            # Update the values in the dataframe
-            df_outliers_removed.loc[(df_outliers_removed["label"] == label), col] = ds[col]
-            
-            n_outliers_removed = len(ds) - len(ds[col].dropna())
-            print(f"Removed {n_outliers_removed} from {col} for {label}") 
+    df_outliers_removed = remove_outliers_chauvenet(df, columns=outlier_columns, group_col="label")
+    n_outliers_removed = df_outliers_removed[outlier_columns].isna().groupby(df["label"]).sum()
+    for label in n_outliers_removed.index:
+        for col in outlier_columns:
+            print(f"Removed {n_outliers_removed.loc[label, col]} from {col} for {label}")
 df_outliers_removed.info()
\ No newline at end of file
@@ -1,45 +1,13 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib as mpl
-from sqlalchemy import create_engine
-from sqlalchemy.exc import SQLAlchemyError
-
-def read_data(table_schema: str,
-                table_name: str,
-                username: str,
-                password: str,
-                hostname: str,
-                port: int,
-                database: str ) -> pd.DataFrame:
-    conn_string = f"postgresql+psycopg2://{username}:{password}@{hostname}:{port}/{database}"
-    engine = create_engine(conn_string)
-    try:
-        # Read table
-        df = pd.read_sql_table(
-            table_name=table_name,
-            schema=table_schema,
-            con=engine
-        )
-        df.index = df["epoch_ms"].astype('datetime64[ns]')
-        # We want epoch_ms only in the index
-        del df["epoch_ms"]
-        engine.dispose()
-    except SQLAlchemyError as e:
-        raise SQLAlchemyError(f"An error ocurred while reading the data: {e}")
-    finally:
-        engine.dispose()
-    return df
+from ..common_functions.storage_functions import get_storage_backend
 
 if __name__ == '__main__':
+    storage = get_storage_backend()
 
-    df = read_data(
+    df = storage.read_table(
         table_schema="merged",
-        table_name="fitness_tracker",
-        username="postgres",
-        password="postgres",
-        hostname="localhost",
-        port=5432,
-        database="ml-fitness-tracker"
+        table_name="fitness_tracker"
     )
     
     df_set_column = df[df["set"] == 1]